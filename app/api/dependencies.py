@@ -1,11 +1,15 @@
 from fastapi import Depends, HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.database.database import get_db
+from app.database import queries
 from app.config import settings
+from cachetools import TTLCache
 import jwt
 from datetime import datetime, timedelta
 import redis.asyncio as redis
+import asyncio
+import hashlib
+import orjson
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -13,9 +17,41 @@ logger = logging.getLogger(__name__)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 redis_client = redis.from_url(settings.redis_url)
 
+# Atomically count a request and start the window on the first hit
+rate_limit_script = redis_client.register_script(
+    "local c = redis.call('INCR', KEYS[1]) "
+    "if c == 1 then redis.call('EXPIRE', KEYS[1], ARGV[1]) end "
+    "return c"
+)
+
+# Decoded tokens keyed by token digest -> (user_id, exp)
+_token_cache = TTLCache(maxsize=10_000, ttl=settings.auth_cache_ttl)
+_token_cache_lock = asyncio.Lock()
+
+async def _decode_token(token: str) -> str:
+    """Return the token's subject, skipping the HMAC verify for recently seen tokens"""
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    async with _token_cache_lock:
+        cached = _token_cache.get(key)
+    if cached is not None:
+        user_id, exp = cached
+        if exp is None or exp > time.time():
+            return user_id
+
+    payload = jwt.decode(
+        token,
+        settings.secret_key,
+        algorithms=[settings.algorithm]
+    )
+    user_id = payload.get("sub")
+    if user_id is not None:
+        async with _token_cache_lock:
+            _token_cache[key] = (user_id, payload.get("exp"))
+    return user_id
+
 async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db)
+    request: Request,
+    token: str = Depends(oauth2_scheme)
 ):
     """Validate JWT token and return current user"""
     credentials_exception = HTTPException(
@@ -24,26 +60,34 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(
-            token,
-            settings.secret_key,
-            algorithms=[settings.algorithm]
-        )
-        user_id: str = payload.get("sub")
+        user_id = await _decode_token(token)
         if user_id is None:
             raise credentials_exception
     except jwt.JWTError:
         raise credentials_exception
+    
+    # Try the short-lived user cache before hitting Postgres
+    cache_key = f"user:{user_id}"
+    try:
+        cached_user = await redis_client.get(cache_key)
+        if cached_user:
+            return orjson.loads(cached_user)
+    except redis.RedisError as e:
+        logger.error(f"Redis error in user lookup: {str(e)}")
         
-    result = await db.execute(
-        "SELECT * FROM users WHERE id = :id",
-        {"id": user_id}
-    )
-    user = result.first()
+    async with request.app.state.pg.acquire() as conn:
+        user = await conn.fetchrow(queries.GET_USER, user_id)
     
     if user is None:
         raise credentials_exception
-    return user
+    
+    # Return the JSON round-tripped row so cache hits and misses yield the same dict
+    payload = orjson.dumps(dict(user), default=str)
+    try:
+        await redis_client.setex(cache_key, settings.auth_cache_ttl, payload)
+    except redis.RedisError as e:
+        logger.error(f"Redis error caching user: {str(e)}")
+    return orjson.loads(payload)
 
 async def rate_limit(request: Request):
     """Rate limiting middleware"""
@@ -51,17 +95,16 @@ async def rate_limit(request: Request):
     key = f"rate_limit:{client_ip}"
     
     try:
-        current = await redis_client.get(key)
-        if current and int(current) >= settings.rate_limit_requests:
+        count = await rate_limit_script(
+            keys=[key],
+            args=[settings.rate_limit_period]
+        )
+        
+        if count > settings.rate_limit_requests:
             raise HTTPException(
                 status_code=429,
                 detail="Too many requests"
             )
-            
-        pipe = redis_client.pipeline()
-        await pipe.incr(key)
-        await pipe.expire(key, settings.rate_limit_period)
-        await pipe.execute()
         
     except redis.RedisError as e:
         logger.error(f"Redis error in rate limiting: {str(e)}")
@@ -1,9 +1,14 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.database.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Request
+import asyncpg
+from app.database.database import get_conn
+from app.database import queries
+from app.database.interactions import interaction_logger
 from app.services.chat_service import ChatService
 from app.services.cocktail_service import CocktailService
+from app.services.llm_service import LLMService
+from app.database.vector_store import VectorStore
 from app.models.schemas import ChatResponse, UserPreference, Cocktail
+from cachetools import TTLCache
 from typing import List, Optional
 from datetime import datetime
 import logging
@@ -11,14 +16,22 @@ import logging
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
-chat_service = ChatService()
-cocktail_service = CocktailService()
+
+# One LLM client (and HTTP connection pool) shared by every service
+llm_service = LLMService()
+vector_store = VectorStore()
+cocktail_service = CocktailService(llm_service, vector_store)
+chat_service = ChatService(llm_service, cocktail_service, vector_store)
+
+# Hot, rarely-changing lookups served from process memory.
+# Cocktail data has no write endpoint, so a reload is visible within the 300 s TTL.
+cocktail_cache: TTLCache = TTLCache(maxsize=4096, ttl=300)
+ingredient_cache: TTLCache = TTLCache(maxsize=4096, ttl=300)
 
 @router.post("/chat", response_model=ChatResponse)
 async def process_chat_message(
     message: str,
-    user_id: str = "ramalMr",
-    db: AsyncSession = Depends(get_db)
+    user_id: str = "ramalMr"
 ):
     """Process chat message and return response"""
     try:
@@ -26,18 +39,7 @@ async def process_chat_message(
         response = await chat_service.process_message(message, user_id)
         
         # Log interaction
-        await db.execute(
-            """
-            INSERT INTO interactions (user_id, interaction_type, created_at)
-            VALUES (:user_id, :type, :created_at)
-            """,
-            {
-                "user_id": user_id,
-                "type": "chat",
-                "created_at": start_time
-            }
-        )
-        await db.commit()
+        interaction_logger.log(user_id, "chat", created_at=start_time)
         
         return response
     except Exception as e:
@@ -47,17 +49,11 @@ async def process_chat_message(
 @router.get("/preferences", response_model=UserPreference)
 async def get_user_preferences(
     user_id: str = "ramalMr",
-    db: AsyncSession = Depends(get_db)
+    conn: asyncpg.Connection = Depends(get_conn)
 ):
     """Get user preferences"""
     try:
-        result = await db.execute(
-            """
-            SELECT * FROM user_preferences WHERE user_id = :user_id
-            """,
-            {"user_id": user_id}
-        )
-        prefs = result.first()
+        prefs = await conn.fetchrow(queries.GET_USER_PREFERENCES, user_id)
         
         if not prefs:
             raise HTTPException(status_code=404, detail="User preferences not found")
@@ -70,48 +66,22 @@ async def get_user_preferences(
 @router.post("/preferences", response_model=UserPreference)
 async def update_user_preferences(
     preferences: UserPreference,
-    db: AsyncSession = Depends(get_db)
+    conn: asyncpg.Connection = Depends(get_conn)
 ):
     """Update user preferences"""
     try:
         await cocktail_service.update_user_preferences(preferences.user_id, preferences)
         
         # Update in database
-        await db.execute(
-            """
-            INSERT INTO user_preferences (
-                user_id,
-                favorite_ingredients,
-                favorite_cocktails,
-                allergies,
-                preferred_alcohol_types,
-                updated_at
-            )
-            VALUES (
-                :user_id,
-                :favorite_ingredients,
-                :favorite_cocktails,
-                :allergies,
-                :preferred_alcohol_types,
-                :updated_at
-            )
-            ON CONFLICT (user_id) DO UPDATE SET
-                favorite_ingredients = EXCLUDED.favorite_ingredients,
-                favorite_cocktails = EXCLUDED.favorite_cocktails,
-                allergies = EXCLUDED.allergies,
-                preferred_alcohol_types = EXCLUDED.preferred_alcohol_types,
-                updated_at = EXCLUDED.updated_at
-            """,
-            {
-                "user_id": preferences.user_id,
-                "favorite_ingredients": preferences.favorite_ingredients,
-                "favorite_cocktails": preferences.favorite_cocktails,
-                "allergies": preferences.allergies,
-                "preferred_alcohol_types": preferences.preferred_alcohol_types,
-                "updated_at": datetime.utcnow()
-            }
+        await conn.execute(
+            queries.UPSERT_USER_PREFERENCES,
+            preferences.user_id,
+            preferences.favorite_ingredients,
+            preferences.favorite_cocktails,
+            preferences.allergies,
+            preferences.preferred_alcohol_types,
+            datetime.utcnow()
         )
-        await db.commit()
         
         return preferences
     except Exception as e:
@@ -122,8 +92,7 @@ async def update_user_preferences(
 async def search_cocktails(
     query: str,
     limit: int = 5,
-    user_id: Optional[str] = None,
-    db: AsyncSession = Depends(get_db)
+    user_id: Optional[str] = None
 ):
     """Search cocktails based on query"""
     try:
@@ -135,22 +104,7 @@ async def search_cocktails(
         
         if user_id:
             # Log search interaction
-            await db.execute(
-                """
-                INSERT INTO interactions (
-                    user_id,
-                    interaction_type,
-                    created_at
-                )
-                VALUES (:user_id, :type, :created_at)
-                """,
-                {
-                    "user_id": user_id,
-                    "type": "search",
-                    "created_at": datetime.utcnow()
-                }
-            )
-            await db.commit()
+            interaction_logger.log(user_id, "search")
             
         return results
     except Exception as e:
@@ -161,22 +115,16 @@ async def search_cocktails(
 async def get_recommendations(
     user_id: str = "ramalMr",
     limit: int = 5,
-    db: AsyncSession = Depends(get_db)
+    conn: asyncpg.Connection = Depends(get_conn)
 ):
     """Get personalized cocktail recommendations"""
     try:
         # Get user preferences
-        result = await db.execute(
-            """
-            SELECT * FROM user_preferences WHERE user_id = :user_id
-            """,
-            {"user_id": user_id}
-        )
-        prefs = result.first()
+        prefs = await conn.fetchrow(queries.GET_USER_PREFERENCES, user_id)
         
         if not prefs:
             # If no preferences, return popular cocktails
-            result = await db.execute(
+            rows = await conn.fetch(
                 """
                 SELECT c.* 
                 FROM cocktails c
@@ -186,12 +134,12 @@ async def get_recommendations(
                     WHERE cocktail_id IS NOT NULL
                     GROUP BY cocktail_id
                     ORDER BY interaction_count DESC
-                    LIMIT :limit
+                    LIMIT $1
                 ) i ON c.id = i.cocktail_id
                 """,
-                {"limit": limit}
+                limit
             )
-            return [Cocktail(**dict(row)) for row in result]
+            return [Cocktail(**dict(row)) for row in rows]
             
         # Get personalized recommendations
         recommendations = await cocktail_service.recommend_cocktails(
@@ -201,18 +149,7 @@ async def get_recommendations(
         )
         
         # Log recommendation interaction
-        await db.execute(
-            """
-            INSERT INTO interactions (user_id, interaction_type, created_at)
-            VALUES (:user_id, :type, :created_at)
-            """,
-            {
-                "user_id": user_id,
-                "type": "recommendation",
-                "created_at": datetime.utcnow()
-            }
-        )
-        await db.commit()
+        interaction_logger.log(user_id, "recommendation")
         
         return recommendations
     except Exception as e:
@@ -221,128 +158,124 @@ async def get_recommendations(
 
 @router.get("/cocktails/{cocktail_id}", response_model=Cocktail)
 async def get_cocktail(
+    request: Request,
     cocktail_id: int,
-    user_id: Optional[str] = None,
-    db: AsyncSession = Depends(get_db)
+    user_id: Optional[str] = None
 ):
     """Get cocktail details by ID"""
     try:
-        result = await db.execute(
-            """
-            SELECT * FROM cocktails WHERE id = :id
-            """,
-            {"id": cocktail_id}
-        )
-        cocktail = result.first()
-        
-        if not cocktail:
-            raise HTTPException(status_code=404, detail="Cocktail not found")
+        cocktail = cocktail_cache.get(cocktail_id)
+        if cocktail is None:
+            # Cache hits never take a pooled connection
+            async with request.app.state.pg.acquire() as conn:
+                row = await conn.fetchrow(queries.GET_COCKTAIL, cocktail_id)
+            
+            if not row:
+                raise HTTPException(status_code=404, detail="Cocktail not found")
+            
+            cocktail = Cocktail(**dict(row))
+            cocktail_cache[cocktail_id] = cocktail
             
         if user_id:
             # Log view interaction
-            await db.execute(
-                """
-                INSERT INTO interactions (
-                    user_id,
-                    cocktail_id,
-                    interaction_type,
-                    created_at
-                )
-                VALUES (
-                    :user_id,
-                    :cocktail_id,
-                    :type,
-                    :created_at
-                )
-                """,
-                {
-                    "user_id": user_id,
-                    "cocktail_id": cocktail_id,
-                    "type": "view",
-                    "created_at": datetime.utcnow()
-                }
-            )
-            await db.commit()
+            interaction_logger.log(user_id, "view", cocktail_id=cocktail_id)
             
-        return Cocktail(**dict(cocktail))
+        return cocktail
     except Exception as e:
         logger.error(f"Error getting cocktail details: {str(e)}")
         raise HTTPException(status_code=500, detail="Error getting cocktail details")
 
 @router.get("/ingredients", response_model=List[str])
 async def get_ingredients(
+    request: Request,
     query: Optional[str] = None,
-    limit: int = 10,
-    db: AsyncSession = Depends(get_db)
+    limit: int = 10
 ):
     """Get list of available ingredients"""
     try:
-        if query:
-            result = await db.execute(
-                """
-                SELECT DISTINCT name
-                FROM ingredients
-                WHERE name ILIKE :query
-                ORDER BY name
-                LIMIT :limit
-                """,
-                {"query": f"%{query}%", "limit": limit}
-            )
-        else:
-            result = await db.execute(
-                """
-                SELECT DISTINCT name
-                FROM ingredients
-                ORDER BY name
-                LIMIT :limit
-                """,
-                {"limit": limit}
-            )
+        cache_key = (query, limit)
+        cached = ingredient_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Cache hits never take a pooled connection
+        async with request.app.state.pg.acquire() as conn:
+            if query:
+                # ILIKE uses the pg_trgm GIN index when the extension is installed. The
+                # ordering is plain SQL (earliest match, then shortest name) so it works without it.
+                rows = await conn.fetch(
+                    """
+                    SELECT name
+                    FROM (
+                        SELECT DISTINCT name
+                        FROM ingredients
+                        WHERE name ILIKE $1
+                    ) matches
+                    ORDER BY strpos(lower(name), lower($2)), length(name), name
+                    LIMIT $3
+                    """,
+                    f"%{query}%",
+                    query,
+                    limit
+                )
+            else:
+                rows = await conn.fetch(
+                    """
+                    SELECT DISTINCT name
+                    FROM ingredients
+                    ORDER BY name
+                    LIMIT $1
+                    """,
+                    limit
+                )
             
-        return [row[0] for row in result]
+        ingredients = [row[0] for row in rows]
+        ingredient_cache[cache_key] = ingredients
+        return ingredients
     except Exception as e:
         logger.error(f"Error getting ingredients: {str(e)}")
         raise HTTPException(status_code=500, detail="Error getting ingredients")
 
 @router.get("/stats/popular", response_model=dict)
-async def get_popular_stats(db: AsyncSession = Depends(get_db)):
+async def get_popular_stats(conn: asyncpg.Connection = Depends(get_conn)):
     """Get popular cocktails and ingredients statistics"""
     try:
-        # Get popular cocktails
-        popular_cocktails = await db.execute(
-            """
-            SELECT 
-                c.name,
-                COUNT(*) as interaction_count
-            FROM interactions i
-            JOIN cocktails c ON i.cocktail_id = c.id
-            WHERE i.cocktail_id IS NOT NULL
-            GROUP BY c.name
-            ORDER BY interaction_count DESC
-            LIMIT 5
+        # Fetch popular cocktails and ingredients in a single round-trip
+        rows = await conn.fetch(
             """
-        )
-        
-        # Get popular ingredients
-        popular_ingredients = await db.execute(
-            """
-            SELECT 
-                name,
-                COUNT(*) as usage_count
-            FROM ingredients i
-            JOIN cocktail_ingredients ci ON i.id = ci.ingredient_id
-            GROUP BY name
-            ORDER BY usage_count DESC
-            LIMIT 5
+            (
+                SELECT 
+                    'cocktail' AS kind,
+                    c.name,
+                    COUNT(*) AS count
+                FROM interactions i
+                JOIN cocktails c ON i.cocktail_id = c.id
+                WHERE i.cocktail_id IS NOT NULL
+                GROUP BY c.name
+                ORDER BY count DESC
+                LIMIT 5
+            )
+            UNION ALL
+            (
+                SELECT 
+                    'ingredient' AS kind,
+                    name,
+                    COUNT(*) AS count
+                FROM ingredients i
+                JOIN cocktail_ingredients ci ON i.id = ci.ingredient_id
+                GROUP BY name
+                ORDER BY count DESC
+                LIMIT 5
+            )
             """
         )
         
         return {
             "popular_cocktails": {
-                row[0]: row[1] for row in popular_cocktails
+                row["name"]: row["count"] for row in rows if row["kind"] == "cocktail"
             },
             "popular_ingredients": {
-                row[0]: row[1] for row in popular_ingredients
+                row["name"]: row["count"] for row in rows if row["kind"] == "ingredient"
             }
         }
     except Exception as e:
@@ -1,6 +1,9 @@
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime, ForeignKey, Float
-from sqlalchemy.orm import declarative_base, sessionmaker
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Float
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.orm import declarative_base
+from fastapi import Request
 from datetime import datetime
+import asyncpg
 import logging
 from app.config import settings
 
@@ -9,13 +12,14 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Create engine
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False}
+engine = create_async_engine(
+    settings.postgres_url.replace("postgresql://", "postgresql+asyncpg://", 1),
+    pool_size=settings.postgres_pool_max_size,
+    max_overflow=0
 )
 
 # Create session factory
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_session = async_sessionmaker(engine, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -34,20 +38,53 @@ class Cocktail(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow)
 
-def init_db():
+async def init_db():
     try:
-        Base.metadata.create_all(bind=engine)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        await _create_search_indexes()
         logger.info("Database initialized successfully")
     except Exception as e:
         logger.error(f"Error initializing database: {str(e)}")
         raise
 
-def get_db():
-    db = SessionLocal()
+async def _create_search_indexes():
+    """Add the trigram index that serves ILIKE '%q%' ingredient lookups"""
     try:
+        async with engine.begin() as conn:
+            await conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            await conn.exec_driver_sql(
+                "CREATE INDEX IF NOT EXISTS idx_ingredients_name_trgm "
+                "ON ingredients USING gin (name gin_trgm_ops)"
+            )
+    except Exception as e:
+        logger.warning(f"Could not create trigram index: {str(e)}")
+
+async def get_db():
+    async with async_session() as db:
         yield db
-    finally:
-        db.close()
+
+async def create_pool() -> asyncpg.Pool:
+    """Create the shared asyncpg connection pool"""
+    try:
+        pool = await asyncpg.create_pool(
+            settings.postgres_url,
+            min_size=settings.postgres_pool_min_size,
+            max_size=settings.postgres_pool_max_size,
+            # Queries are prepared and cached per connection on first use
+            statement_cache_size=settings.postgres_statement_cache_size
+        )
+        logger.info("Database connection pool created")
+        return pool
+    except Exception as e:
+        logger.error(f"Error creating database pool: {str(e)}")
+        raise
+
+async def get_conn(request: Request):
+    """Yield a pooled connection for the duration of a request"""
+    async with request.app.state.pg.acquire() as conn:
+        yield conn
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    import asyncio
+    asyncio.run(init_db())
\ No newline at end of file
@@ -0,0 +1,110 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import asyncpg
+import orjson
+import logging
+from app.utils.telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+class InteractionLogger:
+    """Buffers interaction rows and writes them in batches off the request path"""
+
+    def __init__(
+        self,
+        maxsize: int = 10_000,
+        batch_size: int = 500,
+        flush_interval: float = 0.05
+    ):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._pool: Optional[asyncpg.Pool] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    def log(
+        self,
+        user_id: str,
+        interaction_type: str,
+        cocktail_id: Optional[int] = None,
+        created_at: Optional[datetime] = None
+    ):
+        """Enqueue an interaction without waiting for the database"""
+        try:
+            self.queue.put_nowait({
+                "user_id": user_id,
+                "cocktail_id": cocktail_id,
+                "type": interaction_type,
+                "created_at": created_at or datetime.utcnow()
+            })
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(f"Interaction queue full, dropped {self.dropped} interactions so far")
+
+    async def start(self, pool: asyncpg.Pool):
+        """Start the background writer on the given connection pool"""
+        self._pool = pool
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the background writer once it has flushed whatever is still queued"""
+        if self._task is not None:
+            # Cancelling could lose a batch already taken off the queue; let the writer finish
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await telemetry.close()
+
+    async def _run(self):
+        # Keep writing until stop() is requested and the queue is empty
+        while not (self._stopping.is_set() and self.queue.empty()):
+            try:
+                first = await asyncio.wait_for(self.queue.get(), self.flush_interval)
+            except asyncio.TimeoutError:
+                continue
+
+            batch = self._drain([first])
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.error(f"Error writing {len(batch)} interactions: {str(e)}")
+
+    def _drain(self, batch: List[Dict]) -> List[Dict]:
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return batch
+
+    async def _flush(self, batch: List[Dict]):
+        """Write a batch of interactions with a single COPY"""
+        # Counters and per-user history go out fire-and-forget
+        await telemetry.send(self._telemetry_commands(batch))
+        
+        async with self._pool.acquire() as conn:
+            await conn.copy_records_to_table(
+                "interactions",
+                records=[
+                    (row["user_id"], row["cocktail_id"], row["type"], row["created_at"])
+                    for row in batch
+                ],
+                columns=["user_id", "cocktail_id", "interaction_type", "created_at"]
+            )
+
+    @staticmethod
+    def _telemetry_commands(batch: List[Dict]) -> List[Tuple]:
+        commands = []
+        for row in batch:
+            history_key = f"user:history:{row['user_id']}"
+            commands.append(("INCR", f"counters:interactions:{row['type']}"))
+            commands.append(("LPUSH", history_key, orjson.dumps(row)))
+            commands.append(("LTRIM", history_key, 0, 99))
+        return commands
+
+interaction_logger = InteractionLogger()
@@ -0,0 +1,33 @@
+def _normalize(sql: str) -> str:
+    """Collapse whitespace so every caller sends byte-identical SQL text"""
+    return " ".join(sql.split())
+
+GET_USER = _normalize("""
+    SELECT * FROM users WHERE id = $1
+""")
+
+GET_USER_PREFERENCES = _normalize("""
+    SELECT * FROM user_preferences WHERE user_id = $1
+""")
+
+UPSERT_USER_PREFERENCES = _normalize("""
+    INSERT INTO user_preferences (
+        user_id,
+        favorite_ingredients,
+        favorite_cocktails,
+        allergies,
+        preferred_alcohol_types,
+        updated_at
+    )
+    VALUES ($1, $2, $3, $4, $5, $6)
+    ON CONFLICT (user_id) DO UPDATE SET
+        favorite_ingredients = EXCLUDED.favorite_ingredients,
+        favorite_cocktails = EXCLUDED.favorite_cocktails,
+        allergies = EXCLUDED.allergies,
+        preferred_alcohol_types = EXCLUDED.preferred_alcohol_types,
+        updated_at = EXCLUDED.updated_at
+""")
+
+GET_COCKTAIL = _normalize("""
+    SELECT * FROM cocktails WHERE id = $1
+""")
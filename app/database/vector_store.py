@@ -7,7 +7,9 @@ import logging
 from app.models.schemas import Cocktail, UserPreference
 from app.config import settings
 import asyncio
-import json
+import orjson
+import os
+import time
 from datetime import datetime
 import redis.asyncio as redis
 from contextlib import asynccontextmanager
@@ -16,25 +18,19 @@ logger = logging.getLogger(__name__)
 
 class VectorStore:
     def __init__(self):
-        self.dimension = 1536  # OpenAI embedding dimension
+        self.dimension = settings.embedding_dimension
         self.cocktail_index = None
         self.user_index = None
         self.redis_client = None
+        self._last_save = 0.0
         self.initialize()
 
     def initialize(self):
         """Initialize FAISS indexes and Redis connection"""
         try:
             # Initialize FAISS indexes
-            self.cocktail_index = faiss.IndexFlatL2(self.dimension)
-            self.user_index = faiss.IndexFlatL2(self.dimension)
-            
-            # Add IVF for faster search in production
-            if settings.is_production and self.cocktail_index.ntotal > 1000:
-                nlist = int(np.sqrt(self.cocktail_index.ntotal))
-                self.cocktail_index = faiss.IndexIVFFlat(
-                    self.cocktail_index, self.dimension, nlist
-                )
+            self.cocktail_index = self._build_index()
+            self.user_index = self._build_index()
             
             # Initialize Redis connection
             self.redis_client = redis.from_url(settings.redis_url)
@@ -45,23 +41,48 @@ class VectorStore:
             logger.error(f"Error initializing vector store: {str(e)}")
             raise
 
-    async def load_indexes(self):
+    def _build_index(self) -> faiss.Index:
+        """Build an inner-product index; vectors are L2-normalized so scores are cosine"""
+        index = faiss.index_factory(
+            self.dimension,
+            settings.vector_index_factory,
+            faiss.METRIC_INNER_PRODUCT
+        )
+        if hasattr(index, "hnsw"):
+            index.hnsw.efConstruction = settings.hnsw_ef_construction
+        return self._apply_search_params(index)
+
+    @staticmethod
+    def _apply_search_params(index: faiss.Index) -> faiss.Index:
+        """Set query-time parameters; they are not taken from a persisted index"""
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = settings.hnsw_ef_search
+        return index
+
+    @staticmethod
+    def _normalize(embeddings: np.ndarray) -> np.ndarray:
+        """Return a float32 copy with unit-length rows"""
+        vectors = np.array(embeddings, dtype=np.float32, ndmin=2)
+        faiss.normalize_L2(vectors)
+        return vectors
+
+    def load_indexes(self):
         """Load existing indexes if available"""
         try:
             index_path = Path(settings.vector_db_path)
             
             # Load cocktail index
             if (index_path / "cocktail_index.faiss").exists():
-                self.cocktail_index = faiss.read_index(
+                self.cocktail_index = self._apply_search_params(faiss.read_index(
                     str(index_path / "cocktail_index.faiss")
-                )
+                ))
                 logger.info("Loaded existing cocktail index")
 
             # Load user index
             if (index_path / "user_index.faiss").exists():
-                self.user_index = faiss.read_index(
+                self.user_index = self._apply_search_params(faiss.read_index(
                     str(index_path / "user_index.faiss")
-                )
+                ))
                 logger.info("Loaded existing user index")
 
         except Exception as e:
@@ -77,24 +98,14 @@ class VectorStore:
             # Save with timestamp for versioning
             timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
             
-            # Save cocktail index
-            cocktail_index_path = index_path / f"cocktail_index_{timestamp}.faiss"
-            faiss.write_index(self.cocktail_index, str(cocktail_index_path))
-            
-            # Update latest symlink
-            latest_link = index_path / "cocktail_index.faiss"
-            if latest_link.exists():
-                latest_link.unlink()
-            latest_link.symlink_to(cocktail_index_path)
-
-            # Save user index similarly
-            user_index_path = index_path / f"user_index_{timestamp}.faiss"
-            faiss.write_index(self.user_index, str(user_index_path))
-            
-            latest_link = index_path / "user_index.faiss"
-            if latest_link.exists():
-                latest_link.unlink()
-            latest_link.symlink_to(user_index_path)
+            # Serialize off the event loop
+            await asyncio.to_thread(
+                self._write_index, self.cocktail_index, index_path, "cocktail_index", timestamp
+            )
+            await asyncio.to_thread(
+                self._write_index, self.user_index, index_path, "user_index", timestamp
+            )
+            self._last_save = time.monotonic()
 
             logger.info("Successfully saved indexes with timestamp: " + timestamp)
 
@@ -102,11 +113,50 @@ class VectorStore:
             logger.error(f"Error saving indexes: {str(e)}")
             raise
 
+    @staticmethod
+    def _write_index(index: faiss.Index, index_path: Path, name: str, timestamp: str):
+        """Write a versioned index file and atomically repoint the latest link at it"""
+        # Per-process names so concurrent writers never share a partial file
+        versioned_path = index_path / f"{name}_{timestamp}_{os.getpid()}.faiss"
+        faiss.write_index(index, str(versioned_path))
+        
+        tmp_link = index_path / f"{name}.faiss.{os.getpid()}.tmp"
+        if tmp_link.is_symlink() or tmp_link.exists():
+            tmp_link.unlink()
+        tmp_link.symlink_to(versioned_path.name)
+        os.replace(tmp_link, index_path / f"{name}.faiss")
+        
+        # Keep the newest few versions and drop the rest
+        versions = sorted(
+            index_path.glob(f"{name}_*.faiss"),
+            key=lambda path: path.stat().st_mtime,
+            reverse=True
+        )
+        for old_path in versions[settings.index_versions_kept:]:
+            if old_path != versioned_path:
+                old_path.unlink(missing_ok=True)
+
+    def reset_cocktail_index(self):
+        """Replace the cocktail index with a new, empty one"""
+        self.cocktail_index = self._build_index()
+
+    async def cache_cocktails(self, cocktails: List[Cocktail]):
+        """Store cocktail payloads in Redis in one round-trip"""
+        pipe = self.redis_client.pipeline(transaction=False)
+        for cocktail in cocktails:
+            pipe.set(
+                f"cocktail:{cocktail.id}",
+                orjson.dumps(cocktail.model_dump()),
+                ex=settings.cache_ttl
+            )
+        await pipe.execute()
+
     async def add_cocktail_embeddings(
         self,
         cocktails: List[Cocktail],
         embeddings: np.ndarray,
-        batch_size: int = 1000
+        batch_size: int = 1000,
+        save: bool = True
     ):
         """Add cocktail embeddings to the index in batches"""
         try:
@@ -118,22 +168,19 @@ class VectorStore:
                 batch_cocktails = cocktails[i:i + batch_size]
                 batch_embeddings = embeddings[i:i + batch_size]
                 
+                # Quantizers (e.g. SQ8) learn their value ranges from the first batch
+                vectors = self._normalize(batch_embeddings)
+                if not self.cocktail_index.is_trained:
+                    self.cocktail_index.train(vectors)
+                
                 # Add to FAISS index
-                self.cocktail_index.add(batch_embeddings)
+                self.cocktail_index.add(vectors)
                 
-                # Store cocktail data in Redis
-                async with self.redis_client.pipeline() as pipe:
-                    for cocktail in batch_cocktails:
-                        key = f"cocktail:{cocktail.id}"
-                        await pipe.set(
-                            key,
-                            json.dumps(cocktail.dict()),
-                            ex=settings.cache_ttl
-                        )
-                    await pipe.execute()
-
-            # Save indexes periodically
-            if len(cocktails) > batch_size:
+                # Store cocktail data in Redis (one round-trip per batch)
+                await self.cache_cocktails(batch_cocktails)
+
+            # Save indexes at most once per save interval
+            if save and time.monotonic() - self._last_save >= settings.index_save_interval:
                 await self.save_indexes()
 
             logger.info(f"Added {len(cocktails)} cocktails to the index")
@@ -142,6 +189,28 @@ class VectorStore:
             logger.error(f"Error adding cocktail embeddings: {str(e)}")
             raise
 
+    async def get_cached_embeddings(self, keys: List[str]) -> List[Optional[np.ndarray]]:
+        """Look up content-addressed embeddings with one MGET; misses are None"""
+        try:
+            raw = await self.redis_client.mget([f"emb:{key}" for key in keys])
+            return [
+                np.frombuffer(data, dtype=np.float16).astype(np.float32) if data else None
+                for data in raw
+            ]
+        except redis.RedisError as e:
+            logger.error(f"Error reading cached embeddings: {str(e)}")
+            return [None] * len(keys)
+
+    async def cache_embeddings(self, keys: List[str], embeddings: np.ndarray):
+        """Store embeddings as float16 bytes with one MSET"""
+        try:
+            await self.redis_client.mset({
+                f"emb:{key}": embedding.astype(np.float16).tobytes()
+                for key, embedding in zip(keys, embeddings)
+            })
+        except redis.RedisError as e:
+            logger.error(f"Error caching embeddings: {str(e)}")
+
     async def find_similar_cocktails(
         self,
         query_embedding: np.ndarray,
@@ -150,29 +219,34 @@ class VectorStore:
     ) -> List[Tuple[Cocktail, float]]:
         """Find similar cocktails using vector similarity"""
         try:
-            min_similarity = min_similarity or settings.MIN_SIMILARITY_SCORE
+            if min_similarity is None:
+                min_similarity = settings.MIN_SIMILARITY_SCORE
             
             # Search in FAISS index
             D, I = self.cocktail_index.search(
-                query_embedding.reshape(1, -1),
+                self._normalize(query_embedding),
                 k * 2  # Get more results for filtering
             )
             
+            # Inner product of unit vectors is cosine similarity
+            mask = (I[0] >= 0) & (D[0] >= min_similarity)
+            idxs = I[0][mask]
+            sims = D[0][mask]
+            if not idxs.size:
+                return []
+            
+            # Fetch all candidate cocktails from Redis in one round-trip
+            cocktail_data = await self.redis_client.mget(
+                [f"cocktail:{idx}" for idx in idxs.tolist()]
+            )
+            
+            # Parse in rank order and stop once k cocktails are built
             results = []
-            for distance, idx in zip(D[0], I[0]):
-                # Convert distance to similarity score (inverse of distance)
-                similarity = 1 / (1 + distance)
-                
-                if similarity < min_similarity:
+            for data, similarity in zip(cocktail_data, sims.tolist()):
+                if not data:
                     continue
-                    
-                # Get cocktail data from Redis
-                cocktail_data = await self.redis_client.get(f"cocktail:{idx}")
-                if cocktail_data:
-                    cocktail = Cocktail(**json.loads(cocktail_data))
-                    results.append((cocktail, similarity))
-                
-                if len(results) >= k:
+                results.append((Cocktail(**orjson.loads(data)), similarity))
+                if len(results) == k:
                     break
             
             return results
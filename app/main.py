@@ -2,22 +2,26 @@ from fastapi import FastAPI, Request, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from datetime import datetime
 import logging
 from typing import Optional
 
-from app.api.routes import router as api_router
+from app.api.routes import router as api_router, llm_service
 from app.api.dependencies import rate_limit, check_api_key
-from app.database.database import init_db
+from app.database.database import init_db, create_pool
+from app.database.interactions import interaction_logger
 from app.config import settings
 from app.utils.logger import setup_logger
+from app.utils.cache import cache
+import asyncio
 
 # Initialize FastAPI app
 app = FastAPI(
     title="Professional Cocktail Advisor",
     description="An AI-powered cocktail recommendation system",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 # Setup logging
@@ -53,10 +57,33 @@ async def startup_event():
         await init_db()
         logger.info("Database initialized successfully")
         
+        # Create shared connection pool
+        app.state.pg = await create_pool()
+        
+        # Expose the shared OpenAI client
+        app.state.openai = llm_service.openai_client
+        
+        # Start batched interaction logging
+        await interaction_logger.start(app.state.pg)
+        
+        # Drop response cache entries that expired while the app was down
+        swept = await asyncio.to_thread(cache.sweep_expired)
+        logger.info(f"Removed {swept} expired response cache entries")
+        
     except Exception as e:
         logger.error(f"Error during startup: {str(e)}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Flush pending work on shutdown"""
+    try:
+        await interaction_logger.stop()
+        await app.state.pg.close()
+        await llm_service.close()
+    except Exception as e:
+        logger.error(f"Error during shutdown: {str(e)}")
+
 @app.get("/", response_class=HTMLResponse)
 async def home(
     request: Request,
@@ -68,7 +95,7 @@ async def home(
         {
             "request": request,
             "user": user,
-            "current_time": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+            "current_time": datetime.utcnow().isoformat(sep=" ", timespec="seconds")
         }
     )
 
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 from typing import List, Optional, Dict
 from datetime import datetime
 import json
@@ -11,7 +11,8 @@ class CocktailBase(BaseModel):
     instructions: str
     thumbnail_url: Optional[str] = None
     
-    @validator('name')
+    @field_validator('name')
+    @classmethod
     def clean_name(cls, v):
         return v.strip().title()
 
@@ -19,11 +20,13 @@ class CocktailIngredientBase(BaseModel):
     name: str
     measure: Optional[str] = None
     
-    @validator('name')
+    @field_validator('name')
+    @classmethod
     def clean_ingredient_name(cls, v):
         return v.strip().lower()
     
-    @validator('measure')
+    @field_validator('measure')
+    @classmethod
     def clean_measure(cls, v):
         if v:
             return v.strip()
@@ -44,8 +47,7 @@ class CocktailInDB(CocktailBase):
     created_at: datetime
     updated_at: datetime
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class CocktailStats(BaseModel):
     total_cocktails: int
@@ -54,7 +56,8 @@ class CocktailStats(BaseModel):
     most_common_ingredients: List[Dict[str, int]]
     popular_categories: List[Dict[str, int]]
     
-    @validator('average_complexity')
+    @field_validator('average_complexity')
+    @classmethod
     def round_complexity(cls, v):
         return round(v, 2)
 
@@ -65,7 +68,8 @@ class CocktailRating(BaseModel):
     comment: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
-    @validator('rating')
+    @field_validator('rating')
+    @classmethod
     def validate_rating(cls, v):
         if not 1 <= v <= 5:
             raise ValueError('Rating must be between 1 and 5')
@@ -80,14 +84,15 @@ class CocktailFilter(BaseModel):
     exclude_ingredients: Optional[List[str]] = None
 
     def to_dict(self) -> dict:
-        return {k: v for k, v in self.dict().items() if v is not None}
+        return {k: v for k, v in self.model_dump().items() if v is not None}
 
 class CocktailSearchResult(BaseModel):
     cocktail: CocktailInDB
     relevance_score: float
     matched_terms: List[str]
     
-    @validator('relevance_score')
+    @field_validator('relevance_score')
+    @classmethod
     def round_score(cls, v):
         return round(v, 3)
 
@@ -95,7 +100,8 @@ class BatchCocktailCreate(BaseModel):
     cocktails: List[CocktailCreate]
     overwrite_existing: bool = False
 
-    @validator('cocktails')
+    @field_validator('cocktails')
+    @classmethod
     def validate_batch_size(cls, v):
         if len(v) > 100:
             raise ValueError('Maximum batch size is 100 cocktails')
@@ -107,4 +113,4 @@ class CocktailExport(BaseModel):
     format_version: str = "1.0"
     
     def to_json(self) -> str:
-        return json.dumps(self.dict(), default=str, indent=2)
\ No newline at end of file
+        return json.dumps(self.model_dump(), default=str, indent=2)
\ No newline at end of file
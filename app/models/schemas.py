@@ -1,13 +1,19 @@
-from pydantic import BaseModel, Field, validator
-from typing import List, Optional, Dict
+from pydantic import BaseModel, Field, field_validator
+from typing import Any, List, Optional, Dict
 from datetime import datetime
 import re
 
+def normalize_query(v: str) -> str:
+    """Replace special characters with spaces and collapse whitespace"""
+    v = re.sub(r'[^\w\s]', ' ', v)
+    return ' '.join(v.split())
+
 class CocktailIngredient(BaseModel):
     name: str
     measure: Optional[str] = None
     
-    @validator('name')
+    @field_validator('name')
+    @classmethod
     def clean_name(cls, v):
         return v.strip().lower()
 
@@ -24,7 +30,8 @@ class Cocktail(BaseModel):
     complexity_score: float = Field(ge=0.0, le=1.0)
     popularity_score: float = Field(ge=0.0, le=1.0)
     
-    @validator('name')
+    @field_validator('name')
+    @classmethod
     def clean_cocktail_name(cls, v):
         return v.strip().title()
 
@@ -36,7 +43,8 @@ class UserPreference(BaseModel):
     preferred_alcohol_types: List[str] = []
     last_updated: datetime = Field(default_factory=datetime.utcnow)
     
-    @validator('favorite_ingredients', 'allergies', 'preferred_alcohol_types')
+    @field_validator('favorite_ingredients', 'allergies', 'preferred_alcohol_types')
+    @classmethod
     def clean_list_items(cls, v):
         return [item.strip().lower() for item in v if item.strip()]
 
@@ -55,11 +63,11 @@ class ChatResponse(BaseModel):
 
 class SearchQuery(BaseModel):
     query: str
-    filters: Dict[str, any] = Field(default_factory=dict)
+    filters: Dict[str, Any] = Field(default_factory=dict)
     limit: int = Field(default=5, ge=1, le=20)
     
-    @validator('query')
+    @field_validator('query')
+    @classmethod
     def clean_query(cls, v):
         # Remove special characters and extra spaces
-        v = re.sub(r'[^\w\s]', ' ', v)
-        return ' '.join(v.split())
\ No newline at end of file
+        return normalize_query(v)
\ No newline at end of file
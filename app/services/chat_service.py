@@ -1,5 +1,9 @@
-from typing import List, Optional, Dict
+from typing import Deque, List, Optional, Dict
+from collections import defaultdict, deque
 from datetime import datetime
+from cachetools import TTLCache
+import itertools
+import hashlib
 import logging
 import asyncio
 import time
@@ -11,12 +15,37 @@ from app.config import settings
 
 logger = logging.getLogger(__name__)
 
+PREFERENCE_KEYS = (
+    "favorite_ingredients",
+    "favorite_cocktails",
+    "allergies",
+    "preferred_alcohol_types"
+)
+
 class ChatService:
-    def __init__(self):
-        self.llm_service = LLMService()
-        self.cocktail_service = CocktailService()
-        self.vector_store = VectorStore()
-        self.conversation_history: Dict[str, List[ChatMessage]] = {}
+    def __init__(
+        self,
+        llm_service: Optional[LLMService] = None,
+        cocktail_service: Optional[CocktailService] = None,
+        vector_store: Optional[VectorStore] = None
+    ):
+        self.llm_service = llm_service or LLMService()
+        self.vector_store = vector_store or VectorStore()
+        self.cocktail_service = cocktail_service or CocktailService(
+            self.llm_service,
+            self.vector_store
+        )
+        # Bounded per-user history; appends evict the oldest message
+        self.conversation_history: Dict[str, Deque[ChatMessage]] = defaultdict(
+            lambda: deque(maxlen=10)
+        )
+        # Whole replies keyed by user, preference version, history and message
+        self.reply_cache: TTLCache = TTLCache(maxsize=4096, ttl=settings.chat_cache_ttl)
+        
+    def reset_user_state(self):
+        """Forget all per-user conversation history and cached replies"""
+        self.conversation_history.clear()
+        self.reply_cache.clear()
         
     async def process_message(
         self,
@@ -27,25 +56,47 @@ class ChatService:
         start_time = time.time()
         
         try:
+            # Reuse the reply to this exact message in the same conversation state
+            key = self._reply_key(user_id, message)
+            cached = self.reply_cache.get(key)
+            
             # Add message to conversation history
             self._add_to_history(user_id, "user", message)
             
-            # Analyze intent
+            if cached is not None:
+                self._add_to_history(user_id, "assistant", cached.message)
+                return cached.model_copy(update={
+                    "processing_time": time.time() - start_time,
+                    "timestamp": datetime.utcnow()
+                })
+            
+            # Analyze intent; the same call extracts the entities the handlers need
             intent = await self._analyze_intent(message)
             
             # Process based on intent
             if intent.get("type") == "recommendation":
                 response = await self._handle_recommendation_intent(message, user_id)
             elif intent.get("type") == "ingredient_query":
-                response = await self._handle_ingredient_query(message)
+                response = await self._handle_ingredient_query(
+                    message,
+                    self._extracted_ingredients(intent)
+                )
             elif intent.get("type") == "preference_update":
-                response = await self._handle_preference_update(message, user_id)
+                response = await self._handle_preference_update(
+                    message,
+                    user_id,
+                    self._extracted_preferences(intent)
+                )
             else:
                 response = await self._handle_general_query(message)
             
             # Add response to conversation history
             self._add_to_history(user_id, "assistant", response.message)
             
+            # Preference updates have side effects and must run every time
+            if intent.get("type") != "preference_update":
+                self.reply_cache[key] = response
+            
             # Calculate processing time
             processing_time = time.time() - start_time
             response.processing_time = processing_time
@@ -61,6 +112,15 @@ class ChatService:
                 timestamp=datetime.utcnow()
             )
 
+    def _reply_key(self, user_id: str, message: str) -> str:
+        """Cache key for a reply to message given the user's current state"""
+        digest = hashlib.sha256()
+        digest.update(f"{user_id}\0{self.cocktail_service.preference_versions[user_id]}".encode())
+        for entry in self.conversation_history.get(user_id, ()):
+            digest.update(f"\0{entry.role}\0{entry.content}".encode())
+        digest.update(f"\0\0{message}".encode())
+        return digest.hexdigest()
+
     async def _analyze_intent(self, message: str) -> Dict:
         """Analyze user message intent using LLM"""
         prompt = f"""
@@ -73,12 +133,28 @@ class ChatService:
         3. preference_update (stating preferences)
         4. general_query (other queries)
         
-        Also extract any relevant entities (ingredients, cocktail names, etc.)
+        Return "type" set to the category name, plus the entities as lists:
+        "ingredients" (every ingredient mentioned), "favorite_ingredients",
+        "favorite_cocktails", "allergies" and "preferred_alcohol_types"
         """
         
         response = await self.llm_service.analyze_text(prompt)
         return response
 
+    @staticmethod
+    def _extracted_ingredients(intent: Dict) -> Optional[List[str]]:
+        """Ingredients found by intent analysis, or None if it returned none usable"""
+        ingredients = intent.get("ingredients")
+        return ingredients if isinstance(ingredients, list) and ingredients else None
+
+    @staticmethod
+    def _extracted_preferences(intent: Dict) -> Optional[Dict[str, List[str]]]:
+        """Preferences found by intent analysis, or None if any list is missing"""
+        preferences = {key: intent.get(key) for key in PREFERENCE_KEYS}
+        if all(isinstance(value, list) for value in preferences.values()):
+            return preferences
+        return None
+
     async def _handle_recommendation_intent(
         self,
         message: str,
@@ -86,12 +162,15 @@ class ChatService:
     ) -> ChatResponse:
         """Handle requests for cocktail recommendations"""
         try:
-            # Get user preferences
-            user_prefs = await self.cocktail_service.get_user_preferences(user_id)
+            # Preference lookup and query embedding are independent; run them together
+            user_prefs, query_embedding = await asyncio.gather(
+                self.cocktail_service.get_user_preferences(user_id),
+                self.cocktail_service.embed_query(message)
+            )
             
             # Get recommended cocktails
-            recommended_cocktails = await self.cocktail_service.recommend_cocktails(
-                message,
+            recommended_cocktails = await self.cocktail_service.recommend_for_embedding(
+                query_embedding,
                 user_prefs,
                 limit=5
             )
@@ -115,11 +194,16 @@ class ChatService:
             logger.error(f"Error handling recommendation: {str(e)}")
             raise
 
-    async def _handle_ingredient_query(self, message: str) -> ChatResponse:
+    async def _handle_ingredient_query(
+        self,
+        message: str,
+        ingredients: Optional[List[str]] = None
+    ) -> ChatResponse:
         """Handle queries about specific ingredients"""
         try:
-            # Extract ingredients from message
-            ingredients = await self.llm_service.extract_ingredients(message)
+            # Extract ingredients from message unless already extracted
+            if ingredients is None:
+                ingredients = await self.llm_service.extract_ingredients(message)
             
             # Get cocktails with these ingredients
             cocktails = await self.cocktail_service.get_cocktails_by_ingredients(
@@ -148,12 +232,14 @@ class ChatService:
     async def _handle_preference_update(
         self,
         message: str,
-        user_id: str
+        user_id: str,
+        preferences: Optional[Dict[str, List[str]]] = None
     ) -> ChatResponse:
         """Handle user preference updates"""
         try:
-            # Extract preferences from message
-            preferences = await self.llm_service.extract_preferences(message)
+            # Extract preferences from message unless already extracted
+            if preferences is None:
+                preferences = await self.llm_service.extract_preferences(message)
             
             # Update user preferences
             await self.cocktail_service.update_user_preferences(
@@ -208,10 +294,7 @@ class ChatService:
             raise
 
     def _add_to_history(self, user_id: str, role: str, content: str):
-        """Add message to conversation history"""
-        if user_id not in self.conversation_history:
-            self.conversation_history[user_id] = []
-            
+        """Add message to conversation history, keeping the last 10 messages"""
         self.conversation_history[user_id].append(
             ChatMessage(
                 role=role,
@@ -219,26 +302,17 @@ class ChatService:
                 timestamp=datetime.utcnow()
             )
         )
-        
-        # Keep only last 10 messages
-        self.conversation_history[user_id] = self.conversation_history[user_id][-10:]
 
     def _prepare_cocktail_context(self, cocktails: List[Cocktail]) -> str:
         """Prepare cocktail information as context for LLM"""
-        context_parts = []
-        for cocktail in cocktails:
-            ingredients_text = ", ".join([
-                f"{i.measure} {i.name}" if i.measure else i.name
-                for i in cocktail.ingredients
-            ])
-            context_parts.append(
-                f"Cocktail: {cocktail.name}\n"
-                f"Category: {cocktail.category}\n"
-                f"Glass: {cocktail.glass_type}\n"
-                f"Ingredients: {ingredients_text}\n"
-                f"Instructions: {cocktail.instructions}\n"
-            )
-        return "\n".join(context_parts)
+        return "\n".join(
+            f"Cocktail: {c.name}\n"
+            f"Category: {c.category}\n"
+            f"Glass: {c.glass_type}\n"
+            f"Ingredients: {', '.join(f'{i.measure} {i.name}' if i.measure else i.name for i in c.ingredients)}\n"
+            f"Instructions: {c.instructions}\n"
+            for c in cocktails
+        )
 
     async def get_conversation_history(
         self,
@@ -246,4 +320,7 @@ class ChatService:
         limit: int = 10
     ) -> List[ChatMessage]:
         """Get conversation history for a user"""
-        return self.conversation_history.get(user_id, [])[-limit:]
\ No newline at end of file
+        history = self.conversation_history.get(user_id)
+        if not history:
+            return []
+        return list(itertools.islice(history, max(0, len(history) - limit), len(history)))
\ No newline at end of file
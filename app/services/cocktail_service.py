@@ -1,44 +1,93 @@
 from typing import List, Dict, Optional, Tuple
+from collections import defaultdict
 import pandas as pd
 import numpy as np
 from app.database.vector_store import VectorStore
-from app.models.schemas import Cocktail, UserPreference, CocktailIngredient
+from app.models.schemas import Cocktail, UserPreference, CocktailIngredient, normalize_query
 from app.services.llm_service import LLMService
 from app.config import settings
 import logging
 import asyncio
 from datetime import datetime
+import hashlib
 import json
+import ast
+import itertools
+import heapq
+import os
+import pickle
+from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
 class CocktailService:
-    def __init__(self):
-        self.vector_store = VectorStore()
-        self.llm_service = LLMService()
-        self.cocktails_df = None
+    def __init__(
+        self,
+        llm_service: Optional[LLMService] = None,
+        vector_store: Optional[VectorStore] = None
+    ):
+        self.vector_store = vector_store or VectorStore()
+        self.llm_service = llm_service or LLMService()
+        self.cocktails: List[Cocktail] = []
+        # Bumped on every preference update so replies built on old preferences go stale
+        self.preference_versions: Dict[str, int] = defaultdict(int)
         self.ingredient_index = {}
+        self.ingredient_vocab: Dict[str, int] = {}
+        self.ingredient_matrix = np.zeros((0, 0), dtype=np.uint8)
+        self._row_by_id: Dict[int, int] = {}
+        self.complexity_scores = np.zeros(0)
+        self._cocktail_cache: Dict[int, Cocktail] = {}
+        self._loaded_data_hash: Optional[str] = None
         
     async def initialize_data(self):
         """Initialize service with cocktail data"""
         try:
-            # Load and process cocktail data
-            self.cocktails_df = pd.read_csv(f"{settings.data_dir}/cocktails.csv")
+            csv_path = Path(settings.data_dir) / "cocktails.csv"
+            data_hash = self._data_hash(csv_path)
+            if data_hash == self._loaded_data_hash and self.cocktails:
+                # Same data already loaded in this process; skip the disk round trip
+                cached = self.cocktails
+            else:
+                if data_hash != self._loaded_data_hash:
+                    # Cocktails cached by id belong to the previous data
+                    self._cocktail_cache.clear()
+                    self._loaded_data_hash = data_hash
+                
+                # Reuse the cocktails and index persisted for this exact CSV and index settings
+                cached = self._load_persisted_cocktails(data_hash)
             
-            # Process ingredients
-            self.cocktails_df['ingredients_list'] = self.cocktails_df['ingredients'].apply(
-                lambda x: [ing.strip() for ing in eval(x)]
+            self.cocktails = cached if cached is not None else self._load_cocktails(csv_path)
+            
+            self.ingredient_matrix, self.ingredient_vocab = self._build_ingredient_matrix(
+                self.cocktails
+            )
+            self._row_by_id = {c.id: row for row, c in enumerate(self.cocktails)}
+            self.complexity_scores = np.fromiter(
+                (c.complexity_score for c in self.cocktails),
+                dtype=np.float64,
+                count=len(self.cocktails)
             )
             
-            # Create ingredient index
-            for idx, row in self.cocktails_df.iterrows():
-                for ingredient in row['ingredients_list']:
-                    if ingredient not in self.ingredient_index:
-                        self.ingredient_index[ingredient] = []
-                    self.ingredient_index[ingredient].append(idx)
+            # Create ingredient index of positions in self.cocktails
+            self.ingredient_index = self._build_ingredient_index(
+                self.ingredient_matrix,
+                self.ingredient_vocab
+            )
             
-            # Generate and store embeddings
-            await self._initialize_embeddings()
+            index = self.vector_store.cocktail_index
+            if (
+                cached is not None
+                and index.d == settings.embedding_dimension
+                and index.ntotal == len(self.cocktails)
+            ):
+                # Embeddings are already indexed; only refresh the cocktail payloads
+                await self.vector_store.cache_cocktails(self.cocktails)
+            else:
+                # Generate and store embeddings into a fresh index
+                self.vector_store.reset_cocktail_index()
+                await self._initialize_embeddings()
+                await self.vector_store.save_indexes()
+                self._persist_cocktails(data_hash)
             
             logger.info("Successfully initialized cocktail service")
             
@@ -46,24 +95,109 @@ class CocktailService:
             logger.error(f"Error initializing cocktail service: {str(e)}")
             raise
 
+    def _load_cocktails(self, csv_path: Path) -> List[Cocktail]:
+        """Parse the cocktail CSV into Cocktail objects"""
+        cocktails_df = pd.read_csv(
+            csv_path,
+            engine="pyarrow",
+            usecols=[
+                'id', 'name', 'alcoholic', 'category', 'glassType', 'instructions',
+                'drinkThumbnail', 'ingredients', 'ingredientMeasures'
+            ],
+            dtype={
+                'id': 'int32',
+                'name': 'string',
+                'alcoholic': 'category',
+                'category': 'category',
+                'glassType': 'category'
+            }
+        )
+        
+        # Parse list columns once, safely, at load time
+        cocktails_df['ingredients_parsed'] = cocktails_df['ingredients'].map(ast.literal_eval)
+        cocktails_df['ingredientMeasures_parsed'] = cocktails_df['ingredientMeasures'].map(
+            ast.literal_eval
+        )
+        
+        # Process ingredients; clean names here since model construction skips validators
+        cocktails_df['ingredients_list'] = cocktails_df['ingredients_parsed'].apply(
+            lambda x: [ing.strip().lower() for ing in x]
+        )
+        cocktails_df['complexity'] = self._calculate_complexity_scores(cocktails_df)
+        
+        # Build every Cocktail once; the DataFrame is not kept after this
+        return [
+            self._create_cocktail_object(row)
+            for row in cocktails_df.itertuples(index=False)
+        ]
+
+    @staticmethod
+    def _data_hash(csv_path: Path) -> str:
+        """Hash the CSV contents together with every setting that shapes the index"""
+        index_settings = (
+            settings.embedding_backend,
+            settings.embedding_model,
+            str(settings.embedding_dimension),
+            settings.vector_index_factory
+        )
+        digest = hashlib.blake2b("\0".join(index_settings).encode(), digest_size=16)
+        digest.update(csv_path.read_bytes())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _load_persisted_cocktails(data_hash: str) -> Optional[List[Cocktail]]:
+        """Load cocktails persisted by a previous start, if they match the current data"""
+        path = Path(settings.vector_db_path) / "cocktails.pkl"
+        try:
+            if path.exists():
+                with open(path, "rb") as f:
+                    persisted_hash, cocktails = pickle.load(f)
+                if persisted_hash == data_hash:
+                    logger.info("Loaded persisted cocktails")
+                    return cocktails
+        except Exception as e:
+            logger.error(f"Error loading persisted cocktails: {str(e)}")
+        return None
+
+    def _persist_cocktails(self, data_hash: str):
+        """Persist cocktails next to the index so the next start can skip embedding"""
+        try:
+            path = Path(settings.vector_db_path)
+            path.mkdir(parents=True, exist_ok=True)
+            tmp_path = path / f"cocktails.pkl.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump((data_hash, self.cocktails), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path / "cocktails.pkl")
+        except Exception as e:
+            logger.error(f"Error persisting cocktails: {str(e)}")
+
     async def _initialize_embeddings(self):
         """Generate and store embeddings for cocktails"""
         try:
-            cocktails = [
-                self._create_cocktail_object(row)
-                for _, row in self.cocktails_df.iterrows()
+            cocktails = self.cocktails
+            
+            # Generate embeddings in provider-sized batches, a few in flight at once
+            batch_size = settings.embedding_batch_size
+            batches = [
+                cocktails[i:i + batch_size]
+                for i in range(0, len(cocktails), batch_size)
             ]
+            semaphore = asyncio.Semaphore(settings.embedding_concurrency)
             
-            # Generate embeddings in batches
-            batch_size = 100
-            for i in range(0, len(cocktails), batch_size):
-                batch = cocktails[i:i + batch_size]
+            async def embed(batch: List[Cocktail]) -> np.ndarray:
                 texts = [
                     f"{c.name} {' '.join([i.name for i in c.ingredients])} {c.instructions}"
                     for c in batch
                 ]
-                embeddings = await self.llm_service.generate_embeddings(texts)
-                await self.vector_store.add_cocktail_embeddings(batch, embeddings)
+                async with semaphore:
+                    return await self._get_or_compute_embeddings(texts)
+            
+            all_embeddings = await asyncio.gather(*(embed(batch) for batch in batches))
+            
+            # Add in order so index positions line up with cocktail ids.
+            # The caller saves the finished index once.
+            for batch, embeddings in zip(batches, all_embeddings):
+                await self.vector_store.add_cocktail_embeddings(batch, embeddings, save=False)
             
             logger.info("Successfully initialized embeddings")
             
@@ -71,50 +205,89 @@ class CocktailService:
             logger.error(f"Error initializing embeddings: {str(e)}")
             raise
 
+    async def _get_or_compute_embeddings(self, texts: List[str]) -> np.ndarray:
+        """Embed texts, reusing vectors cached under a hash of model name and text"""
+        keys = [
+            hashlib.blake2b(
+                f"{settings.embedding_model}:{text}".encode(),
+                digest_size=16
+            ).hexdigest()
+            for text in texts
+        ]
+        embeddings = await self.vector_store.get_cached_embeddings(keys)
+        
+        # Only send cache misses to the embedding provider
+        misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if misses:
+            computed = await self.llm_service.generate_embeddings([texts[i] for i in misses])
+            await self.vector_store.cache_embeddings([keys[i] for i in misses], computed)
+            for i, embedding in zip(misses, computed):
+                embeddings[i] = embedding
+        
+        return np.vstack(embeddings)
+
+    async def embed_query(self, query: str) -> np.ndarray:
+        """Embed a search query; queries equal after normalization share a cached vector"""
+        embedding = await self.llm_service.embed_one(
+            query,
+            cache_key=normalize_query(query) or query
+        )
+        return np.asarray(embedding, dtype=np.float32)
+
     def _create_cocktail_object(self, row) -> Cocktail:
-        """Create Cocktail object from DataFrame row"""
+        """Create Cocktail object from a trusted DataFrame row tuple without validation"""
+        cocktail_id = int(row.id)
+        cached = self._cocktail_cache.get(cocktail_id)
+        if cached is not None:
+            return cached
+        
         ingredients = [
-            CocktailIngredient(
-                name=ing.strip(),
+            CocktailIngredient.model_construct(
+                name=ing,
                 measure=measure.strip() if pd.notna(measure) else None
             )
             for ing, measure in zip(
-                eval(row['ingredients']),
-                eval(row['ingredientMeasures'])
+                row.ingredients_list,
+                row.ingredientMeasures_parsed
             )
         ]
         
-        return Cocktail(
-            id=row['id'],
-            name=row['name'],
-            alcoholic=row['alcoholic'].lower() == 'alcoholic',
-            category=row['category'],
-            glass_type=row['glassType'],
-            instructions=row['instructions'],
-            thumbnail_url=row['drinkThumbnail'],
+        cocktail = Cocktail.model_construct(
+            id=cocktail_id,
+            name=row.name.strip().title(),
+            alcoholic=row.alcoholic.lower() == 'alcoholic',
+            category=row.category,
+            glass_type=row.glassType,
+            instructions=row.instructions,
+            thumbnail_url=row.drinkThumbnail,
             ingredients=ingredients,
-            complexity_score=self._calculate_complexity_score(row),
+            complexity_score=float(row.complexity),
             popularity_score=0.5  # Default score, could be updated based on user interactions
         )
+        self._cocktail_cache[cocktail_id] = cocktail
+        return cocktail
 
-    def _calculate_complexity_score(self, row) -> float:
-        """Calculate cocktail complexity score"""
+    @staticmethod
+    def _calculate_complexity_scores(df: pd.DataFrame) -> pd.Series:
+        """Calculate complexity scores for every cocktail at once"""
         # Factors considered:
         # 1. Number of ingredients
         # 2. Length of instructions
         # 3. Presence of special techniques
         
-        ingredients_score = min(len(eval(row['ingredients'])) / 10, 1.0)
+        ingredients_score = np.minimum(df['ingredients_parsed'].str.len() / 10, 1.0)
         
-        instructions_score = min(len(row['instructions']) / 500, 1.0)
+        instructions_score = np.minimum(df['instructions'].str.len() / 500, 1.0)
         
         technique_words = ['shake', 'stir', 'blend', 'muddle', 'layer', 'float']
+        instructions = df['instructions'].str.lower()
         technique_score = sum(
-            1 for word in technique_words
-            if word in row['instructions'].lower()
+            instructions.str.contains(word, regex=False).astype(np.uint8)
+            for word in technique_words
         ) / len(technique_words)
         
-        return (ingredients_score * 0.4 + instructions_score * 0.3 + technique_score * 0.3)
+        scores = ingredients_score * 0.4 + instructions_score * 0.3 + technique_score * 0.3
+        return scores.clip(0.0, 1.0)
 
     async def recommend_cocktails(
         self,
@@ -125,19 +298,34 @@ class CocktailService:
         """Get personalized cocktail recommendations"""
         try:
             # Generate query embedding
-            query_embedding = await self.llm_service.generate_embeddings([query])
+            query_embedding = await self.embed_query(query)
+            
+            return await self.recommend_for_embedding(query_embedding, user_prefs, limit)
             
+        except Exception as e:
+            logger.error(f"Error recommending cocktails: {str(e)}")
+            return []
+
+    async def recommend_for_embedding(
+        self,
+        query_embedding: np.ndarray,
+        user_prefs: Optional[UserPreference] = None,
+        limit: int = 5
+    ) -> List[Cocktail]:
+        """Get personalized recommendations for an already embedded query"""
+        try:
             # Get similar cocktails
             similar_cocktails = await self.vector_store.find_similar_cocktails(
-                query_embedding[0],
-                k=limit * 2  # Get more for filtering
+                query_embedding,
+                k=limit * 4  # Get more for filtering and approximate recall
             )
             
             # Apply user preferences if available
             if user_prefs:
                 filtered_cocktails = self._apply_user_preferences(
                     [c for c, _ in similar_cocktails],
-                    user_prefs
+                    user_prefs,
+                    limit
                 )
             else:
                 filtered_cocktails = [c for c, _ in similar_cocktails]
@@ -148,46 +336,99 @@ class CocktailService:
             logger.error(f"Error recommending cocktails: {str(e)}")
             return []
 
+    @staticmethod
+    def _build_ingredient_matrix(
+        cocktails: List[Cocktail]
+    ) -> Tuple[np.ndarray, Dict[str, int]]:
+        """Build a cocktails x ingredient-vocabulary membership matrix"""
+        vocab: Dict[str, int] = {}
+        for cocktail in cocktails:
+            for ing in cocktail.ingredients:
+                vocab.setdefault(ing.name, len(vocab))
+        
+        matrix = np.zeros((len(cocktails), len(vocab)), dtype=np.uint8)
+        for row, cocktail in enumerate(cocktails):
+            matrix[row, [vocab[ing.name] for ing in cocktail.ingredients]] = 1
+        return matrix, vocab
+
+    @staticmethod
+    def _build_ingredient_index(
+        matrix: np.ndarray,
+        vocab: Dict[str, int]
+    ) -> Dict[str, List[int]]:
+        """Invert the membership matrix into ingredient -> cocktail positions"""
+        # Nonzeros of the transpose come out grouped by ingredient, positions ascending
+        columns, rows = np.nonzero(matrix.T)
+        splits = np.cumsum(np.bincount(columns, minlength=len(vocab)))[:-1]
+        positions = np.split(rows, splits)
+        return {name: positions[col].tolist() for name, col in vocab.items()}
+
+    def _ingredient_rows(
+        self,
+        cocktails: List[Cocktail]
+    ) -> Tuple[np.ndarray, Dict[str, int]]:
+        """Membership rows for the given cocktails, sliced from the prebuilt matrix when possible"""
+        rows = [self._row_by_id.get(c.id) for c in cocktails]
+        # Ids alone are not enough: a caller's cocktail may reuse a dataset id
+        if all(
+            row is not None and (
+                self.cocktails[row] is c
+                or self.cocktails[row].ingredients == c.ingredients
+            )
+            for row, c in zip(rows, cocktails)
+        ):
+            return self.ingredient_matrix[rows], self.ingredient_vocab
+        # Cocktails outside the loaded dataset get a matrix of their own
+        return self._build_ingredient_matrix(cocktails)
+
     def _apply_user_preferences(
         self,
         cocktails: List[Cocktail],
-        prefs: UserPreference
+        prefs: UserPreference,
+        limit: Optional[int] = None
     ) -> List[Cocktail]:
         """Filter and sort cocktails based on user preferences"""
-        scored_cocktails = []
+        if not cocktails:
+            return []
         
-        for cocktail in cocktails:
-            score = 0.0
-            
-            # Check favorite ingredients
-            for ing in prefs.favorite_ingredients:
-                if any(i.name.lower() == ing.lower() for i in cocktail.ingredients):
-                    score += 0.3
-                    
-            # Check allergies (exclude cocktails with allergens)
-            if any(
-                any(a.lower() in i.name.lower() for i in cocktail.ingredients)
-                for a in prefs.allergies
-            ):
-                continue
-                
-            # Check preferred alcohol types
-            if any(
-                any(p.lower() in i.name.lower() for i in cocktail.ingredients)
-                for p in prefs.preferred_alcohol_types
-            ):
-                score += 0.2
-                
-            # Check favorite cocktails
-            if cocktail.name in prefs.favorite_cocktails:
-                score += 0.5
-                
-            scored_cocktails.append((cocktail, score))
-            
-        # Sort by score and return cocktails
-        return [
-            c for c, s in sorted(scored_cocktails, key=lambda x: x[1], reverse=True)
+        matrix, vocab = self._ingredient_rows(cocktails)
+        
+        # Ingredient names and preference lists are already lowercased by their validators
+        def matching(terms: List[str]) -> List[int]:
+            # Vocabulary columns whose ingredient name contains any of the terms
+            return [col for name, col in vocab.items() if any(t in name for t in terms)]
+        
+        # Favorite ingredients score per exact match
+        favorite_cols = [
+            vocab[ing] for ing in set(prefs.favorite_ingredients) if ing in vocab
         ]
+        scores = matrix[:, favorite_cols].sum(axis=1) * 0.3
+        
+        # Preferred alcohol types score once per cocktail
+        scores += matrix[:, matching(prefs.preferred_alcohol_types)].any(axis=1) * 0.2
+        
+        # Favorite cocktails
+        favorite_names = set(prefs.favorite_cocktails)
+        scores += np.fromiter(
+            (c.name in favorite_names for c in cocktails),
+            dtype=bool,
+            count=len(cocktails)
+        ) * 0.5
+        
+        # Exclude cocktails with allergens
+        allergic = matrix[:, matching(prefs.allergies)].any(axis=1)
+        
+        keep = np.flatnonzero(~allergic)
+        
+        # Only the top `limit` are consumed; select them without a full sort
+        if limit is not None and limit < keep.size:
+            score_list = scores.tolist()
+            top = heapq.nlargest(limit, keep.tolist(), key=score_list.__getitem__)
+            return [cocktails[i] for i in top]
+        
+        # Sort by score, keeping the similarity order among ties
+        order = keep[np.argsort(-scores[keep], kind="stable")]
+        return [cocktails[i] for i in order]
 
     async def get_cocktails_by_ingredients(
         self,
@@ -196,28 +437,23 @@ class CocktailService:
     ) -> List[Cocktail]:
         """Find cocktails containing specific ingredients"""
         try:
-            # Get cocktail indices for each ingredient
-            cocktail_sets = [
-                set(self.ingredient_index.get(ing.lower(), []))
-                for ing in ingredients
-            ]
-            
-            if not cocktail_sets:
+            # Get the matrix column for each ingredient; an unknown one matches nothing
+            cols = [self.ingredient_vocab.get(ing.lower()) for ing in ingredients]
+            if not cols or None in cols:
                 return []
             
             # Find cocktails containing all ingredients
-            matching_indices = set.intersection(*cocktail_sets)
+            matching_indices = np.flatnonzero(self.ingredient_matrix[:, cols].all(axis=1))
             
-            # Create cocktail objects
-            matching_cocktails = [
-                self._create_cocktail_object(self.cocktails_df.iloc[idx])
-                for idx in matching_indices
-            ]
+            # Keep the top `limit` by complexity score without a full sort
+            scores = self.complexity_scores[matching_indices]
+            if matching_indices.size > limit:
+                top = np.argpartition(-scores, limit)[:limit]
+                matching_indices, scores = matching_indices[top], scores[top]
             
             # Sort by complexity score
-            matching_cocktails.sort(key=lambda x: x.complexity_score, reverse=True)
-            
-            return matching_cocktails[:limit]
+            order = np.argsort(-scores, kind="stable")
+            return [self.cocktails[idx] for idx in matching_indices[order]]
             
         except Exception as e:
             logger.error(f"Error finding cocktails by ingredients: {str(e)}")
@@ -232,11 +468,11 @@ class CocktailService:
         """Search cocktails based on query"""
         try:
             # Generate query embedding
-            query_embedding = await self.llm_service.generate_embeddings([query])
+            query_embedding = await self.embed_query(query)
             
             # Get similar cocktails
             similar_cocktails = await self.vector_store.find_similar_cocktails(
-                query_embedding[0],
+                query_embedding,
                 k=limit
             )
             
@@ -246,7 +482,8 @@ class CocktailService:
                 if user_prefs:
                     similar_cocktails = self._apply_user_preferences(
                         [c for c, _ in similar_cocktails],
-                        user_prefs
+                        user_prefs,
+                        limit
                     )
                     return similar_cocktails[:limit]
             
@@ -275,19 +512,20 @@ class CocktailService:
         """Update user preferences"""
         try:
             # Generate embedding for preferences
-            pref_text = (
-                f"{' '.join(preferences.favorite_ingredients)} "
-                f"{' '.join(preferences.favorite_cocktails)} "
-                f"{' '.join(preferences.preferred_alcohol_types)}"
-            )
+            pref_text = " ".join(itertools.chain(
+                preferences.favorite_ingredients,
+                preferences.favorite_cocktails,
+                preferences.preferred_alcohol_types
+            ))
             embedding = await self.llm_service.generate_embeddings([pref_text])
             
-            # Store preferences and embedding
+            # Store the already-validated preferences as plain data
             await self.vector_store.update_user_preferences(
                 user_id,
-                preferences,
+                preferences.model_dump(),
                 embedding[0]
             )
+            self.preference_versions[user_id] += 1
             
             return True
             
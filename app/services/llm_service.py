@@ -1,28 +1,116 @@
 from langchain.chat_models import ChatOpenAI
-from langchain.embeddings import OpenAIEmbeddings
 from langchain.prompts import PromptTemplate
 from langchain.chains import ConversationChain
 from langchain.memory import ConversationBufferMemory
+from langchain.storage import LocalFileStore
 from app.config import settings
+from app.utils.cache import semantic_cached
+from openai import AsyncOpenAI
+from sentence_transformers import SentenceTransformer
+import httpx
 import numpy as np
-from typing import List, Dict, Any
+from typing import Awaitable, Callable, List, Dict, Any, Optional, Set, Tuple
 import logging
 import asyncio
-import json
+import orjson
+import hashlib
+from collections import OrderedDict
 from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
+def create_openai_client() -> AsyncOpenAI:
+    """Create an OpenAI client whose HTTP/2 connections are shared by every caller"""
+    return AsyncOpenAI(
+        api_key=settings.openai_api_key,
+        http_client=httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=50)
+        )
+    )
+
+class MicroBatcher:
+    """Coalesces concurrent single-text embedding calls into one batched call"""
+
+    def __init__(
+        self,
+        embed_batch: Callable[[List[str]], Awaitable[np.ndarray]],
+        max_batch: int = 32,
+        flush_ms: float = 5
+    ):
+        self._embed_batch = embed_batch
+        self.max_batch = max_batch
+        self.flush_interval = flush_ms / 1000
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def embed_one(self, text: str) -> np.ndarray:
+        """Queue a text and wait for its embedding from the next batch"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        
+        # Flush when the batch is full, otherwise after the flush interval
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.flush_interval, self._flush)
+        
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: List[Tuple[str, asyncio.Future]]):
+        try:
+            embeddings = await self._embed_batch([text for text, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
 class LLMService:
-    def __init__(self):
+    def __init__(self, openai_client: Optional[AsyncOpenAI] = None):
+        self.openai_client = openai_client or create_openai_client()
         self.llm = ChatOpenAI(
             temperature=settings.temperature,
             model_name=settings.model_name,
-            max_tokens=settings.max_tokens
+            max_tokens=settings.max_tokens,
+            async_client=self.openai_client.chat.completions
         )
-        self.embeddings = OpenAIEmbeddings(
-            model="text-embedding-ada-002"
+        # Structured calls are constrained to a single valid JSON object
+        self.json_llm = ChatOpenAI(
+            temperature=settings.temperature,
+            model_name=settings.json_model_name,
+            max_tokens=settings.max_tokens,
+            async_client=self.openai_client.chat.completions,
+            model_kwargs={"response_format": {"type": "json_object"}}
         )
+        # Local model for the default embedding backend
+        self.local_embedder = None
+        if settings.embedding_backend == "local":
+            self.local_embedder = SentenceTransformer(settings.embedding_model)
+        self.embedding_batcher = MicroBatcher(self.generate_embeddings)
+        # Recently embedded single texts; repeated queries skip the model entirely
+        self._recent_embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        # Provider embeddings persisted on disk, keyed by model and text hash
+        self.embedding_store = LocalFileStore(f"{settings.embeddings_dir}/embed_cache")
+        # Caps concurrent embedding requests to stay within provider rate limits
+        self._embedding_semaphore = asyncio.Semaphore(settings.embedding_concurrency)
         self.memory = ConversationBufferMemory()
         
         # Initialize prompt templates
@@ -30,14 +118,12 @@ class LLMService:
         
     def _initialize_prompts(self):
         """Initialize various prompt templates"""
-        self.cocktail_prompt = PromptTemplate(
-            input_variables=["context", "question"],
-            template="""
+        # Hot prompts are plain head/tail strings joined with an f-string per call
+        self._cocktail_head = """
             You are a professional bartender and cocktail expert. Use the following context to answer the question:
             
-            Context: {context}
-            
-            Question: {question}
+            Context: """
+        self._cocktail_tail = """
             
             Provide a detailed and helpful response. If making drink recommendations, include:
             1. Preparation instructions
@@ -48,7 +134,6 @@ class LLMService:
             
             Keep the tone professional but friendly.
             """
-        )
         
         self.ingredient_analysis_prompt = PromptTemplate(
             input_variables=["ingredients"],
@@ -66,12 +151,11 @@ class LLMService:
             """
         )
         
-        self.preference_extraction_prompt = PromptTemplate(
-            input_variables=["message"],
-            template="""
+        self._preference_head = """
             Extract cocktail preferences from this message:
             
-            Message: {message}
+            Message: """
+        self._preference_tail = """
             
             Please identify:
             1. Favorite ingredients
@@ -82,7 +166,6 @@ class LLMService:
             
             Format the response as JSON with these categories.
             """
-        )
 
     async def generate_response(
         self,
@@ -94,13 +177,11 @@ class LLMService:
         retries = 0
         while retries < max_retries:
             try:
-                response = await self.llm.agenerate([
-                    self.cocktail_prompt.format(
-                        context=context,
-                        question=query
-                    )
-                ])
-                return response.generations[0][0].text
+                return await self._complete(
+                    f"{self._cocktail_head}{context}\n            \n            "
+                    f"Question: {query}{self._cocktail_tail}",
+                    query
+                )
                 
             except Exception as e:
                 retries += 1
@@ -112,28 +193,119 @@ class LLMService:
     async def generate_embeddings(
         self,
         texts: List[str],
-        batch_size: int = 100
+        batch_size: int = None
     ) -> np.ndarray:
         """Generate embeddings for texts"""
         try:
-            all_embeddings = []
+            # Embed each distinct text once, then scatter back to the input order
+            unique = {}
+            order = [unique.setdefault(text, len(unique)) for text in texts]
+            if len(unique) < len(texts):
+                return (await self.generate_embeddings(list(unique), batch_size))[order]
+            
+            if self.local_embedder is not None:
+                # Encoding is compute bound; keep it off the event loop
+                return await asyncio.to_thread(
+                    self.local_embedder.encode,
+                    texts,
+                    batch_size=64,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True
+                )
+            
+            batch_size = batch_size or settings.embedding_batch_size
+            
+            # Texts embedded on an earlier run are read back instead of billed again
+            keys = [
+                settings.embedding_model + hashlib.sha1(text.encode()).hexdigest()
+                for text in texts
+            ]
+            stored = await asyncio.to_thread(self.embedding_store.mget, keys)
+            embeddings = [orjson.loads(value) if value else None for value in stored]
+            misses = [i for i, embedding in enumerate(embeddings) if embedding is None]
             
-            # Process in batches
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i + batch_size]
-                embeddings = await self.embeddings.aembed_documents(batch)
-                all_embeddings.extend(embeddings)
+            if misses:
+                # One request per batch, all batches in flight at once (bounded)
+                results = await asyncio.gather(*(
+                    self._bounded(self._embed_batch(
+                        [texts[j] for j in misses[i:i + batch_size]]
+                    ))
+                    for i in range(0, len(misses), batch_size)
+                ))
+                computed = [e for batch in results for e in batch]
+                for i, embedding in zip(misses, computed):
+                    embeddings[i] = embedding
+                await asyncio.to_thread(
+                    self.embedding_store.mset,
+                    [(keys[i], orjson.dumps(embedding)) for i, embedding in zip(misses, computed)]
+                )
             
-            return np.array(all_embeddings)
+            return np.array(embeddings)
             
         except Exception as e:
             logger.error(f"Error generating embeddings: {str(e)}")
             raise
 
+    async def _bounded(self, coro: Awaitable) -> Any:
+        """Await a provider call under the shared concurrency limit"""
+        async with self._embedding_semaphore:
+            return await coro
+
+    async def embed_one(self, text: str, cache_key: Optional[str] = None) -> np.ndarray:
+        """Embed a single text, sharing one batched call with concurrent callers
+
+        Texts with the same `cache_key` (default: the text itself) share one cached vector.
+        """
+        key = cache_key or text
+        embedding = self._recent_embeddings.get(key)
+        if embedding is not None:
+            self._recent_embeddings.move_to_end(key)
+            return embedding
+        
+        embedding = await self.embedding_batcher.embed_one(text)
+        self._recent_embeddings[key] = embedding
+        if len(self._recent_embeddings) > settings.query_embedding_cache_size:
+            self._recent_embeddings.popitem(last=False)
+        return embedding
+
+    async def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        """Embed a whole batch with a single request to the provider's batch endpoint"""
+        response = await self.openai_client.embeddings.create(
+            model=settings.embedding_model,
+            input=batch
+        )
+        data = getattr(response, "data", None)
+        if data and len(data) == len(batch):
+            return [item.embedding for item in sorted(data, key=lambda item: item.index)]
+        
+        # Provider ignored the array input; fall back to one request per text
+        logger.warning("Batch embedding response incomplete, falling back to sequential calls")
+        embeddings = []
+        for text in batch:
+            response = await self.openai_client.embeddings.create(
+                model=settings.embedding_model,
+                input=text
+            )
+            embeddings.append(response.data[0].embedding)
+        return embeddings
+
+    @semantic_cached(ttl=3600)
+    async def _complete(self, prompt: str, query: str) -> str:
+        """Run a prompt through the chat model; query is the user text inside it"""
+        response = await self.llm.agenerate([prompt])
+        return response.generations[0][0].text
+
+    # Exact prompts only: near-duplicate queries can name different ingredients or likes
+    @semantic_cached(ttl=3600, semantic=False, llm_attr="json_llm")
+    async def _complete_json(self, prompt: str, query: str) -> str:
+        """Run a prompt through the JSON-mode chat model; query is the user text inside it"""
+        response = await self.json_llm.agenerate([prompt])
+        return response.generations[0][0].text
+
     async def analyze_text(self, text: str) -> Dict[str, Any]:
         """Analyze text for intent and entities"""
         try:
-            response = await self.llm.agenerate([
+            response = await self._complete_json(
                 f"""
                 Analyze this text and extract:
                 1. Primary intent
@@ -145,10 +317,11 @@ class LLMService:
                 Text: {text}
                 
                 Provide analysis as JSON.
-                """
-            ])
+                """,
+                text
+            )
             
-            return json.loads(response.generations[0][0].text)
+            return orjson.loads(response)
             
         except Exception as e:
             logger.error(f"Error analyzing text: {str(e)}")
@@ -163,17 +336,19 @@ class LLMService:
     async def extract_ingredients(self, text: str) -> List[str]:
         """Extract ingredient mentions from text"""
         try:
-            response = await self.llm.agenerate([
+            response = await self._complete_json(
                 f"""
                 Extract all ingredient mentions from this text:
                 
                 {text}
                 
-                Return only the ingredient names as a JSON array.
-                """
-            ])
+                Return a JSON object with an "ingredients" key holding only the ingredient names.
+                """,
+                text
+            )
             
-            return json.loads(response.generations[0][0].text)
+            # JSON mode only returns objects, so the list comes wrapped
+            return orjson.loads(response).get("ingredients", [])
             
         except Exception as e:
             logger.error(f"Error extracting ingredients: {str(e)}")
@@ -182,11 +357,12 @@ class LLMService:
     async def extract_preferences(self, text: str) -> Dict[str, List[str]]:
         """Extract user preferences from text"""
         try:
-            response = await self.llm.agenerate([
-                self.preference_extraction_prompt.format(message=text)
-            ])
+            response = await self._complete_json(
+                f"{self._preference_head}{text}{self._preference_tail}",
+                text
+            )
             
-            return json.loads(response.generations[0][0].text)
+            return orjson.loads(response)
             
         except Exception as e:
             logger.error(f"Error extracting preferences: {str(e)}")
@@ -235,4 +411,8 @@ class LLMService:
             
         except Exception as e:
             logger.error(f"Error generating ingredient response: {str(e)}")
-            return "I apologize, but I'm having trouble generating a response about these ingredients."
\ No newline at end of file
+            return "I apologize, but I'm having trouble generating a response about these ingredients."
+
+    async def close(self):
+        """Close the underlying HTTP connections"""
+        await self.openai_client.close()
@@ -23,7 +23,7 @@ class UserService:
             # Try to get from cache first
             cached_prefs = await self.redis_client.get(f"user:prefs:{user_id}")
             if cached_prefs:
-                return UserPreference(**json.loads(cached_prefs))
+                return UserPreference.model_validate_json(cached_prefs)
             
             # If not in cache, get from vector store
             prefs = await self.vector_store.get_user_preferences(user_id)
@@ -31,7 +31,7 @@ class UserService:
                 # Cache for future use
                 await self.redis_client.set(
                     f"user:prefs:{user_id}",
-                    json.dumps(prefs.dict()),
+                    prefs.model_dump_json(),
                     ex=settings.cache_ttl
                 )
             return prefs
@@ -58,7 +58,7 @@ class UserService:
                 # Update cache
                 await self.redis_client.set(
                     f"user:prefs:{user_id}",
-                    json.dumps(preferences.dict()),
+                    preferences.model_dump_json(),
                     ex=settings.cache_ttl
                 )
             
@@ -94,12 +94,12 @@ class UserService:
         """Add interaction to user's history"""
         try:
             interaction['timestamp'] = datetime.utcnow().isoformat()
-            await self.redis_client.lpush(
-                f"user:history:{user_id}",
-                json.dumps(interaction)
-            )
+            key = f"user:history:{user_id}"
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.lpush(key, json.dumps(interaction))
             # Keep only last 100 interactions
-            await self.redis_client.ltrim(f"user:history:{user_id}", 0, 99)
+            pipe.ltrim(key, 0, 99)
+            await pipe.execute()
             
         except Exception as e:
             logger.error(f"Error adding to user history: {str(e)}")
@@ -1,7 +1,18 @@
 import sqlite3
-import json
-from datetime import datetime, timedelta
+import orjson
+from typing import Any, List, Optional, Tuple
+from cachetools import TTLCache
+import numpy as np
+import faiss
 import threading
+import functools
+import hashlib
+import asyncio
+import logging
+import time
+from app.config import settings
+
+logger = logging.getLogger(__name__)
 
 class SQLiteCache:
     _instance = None
@@ -14,47 +25,181 @@ class SQLiteCache:
                     cls._instance = super().__new__(cls)
         return cls._instance
     
+    _GET_SQL = "SELECT value FROM cache_entries WHERE key = ? AND expires_at > ?"
+    _SET_SQL = "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)"
+    _DELETE_SQL = "DELETE FROM cache_entries WHERE key = ?"
+    _SWEEP_SQL = "DELETE FROM cache_entries WHERE expires_at <= ?"
+    
     def __init__(self):
+        # The singleton is re-initialized on every SQLiteCache() call; connect once
+        if getattr(self, "_conn", None) is not None:
+            return
         self.db_name = "cache.db"
+        self._conn_lock = threading.Lock()
+        # Readers get one connection per worker thread so WAL reads run in parallel
+        self._readers = threading.local()
+        self._conn = sqlite3.connect(
+            self.db_name,
+            check_same_thread=False,
+            isolation_level=None
+        )
         self._init_db()
     
     def _init_db(self):
-        with sqlite3.connect(self.db_name) as conn:
-            conn.execute("""
-                CREATE TABLE IF NOT EXISTS cache (
+        with self._conn_lock:
+            self._conn.executescript("""
+                PRAGMA journal_mode=WAL;
+                PRAGMA synchronous=NORMAL;
+                PRAGMA temp_store=MEMORY;
+                PRAGMA mmap_size=268435456;
+                CREATE TABLE IF NOT EXISTS cache_entries (
                     key TEXT PRIMARY KEY,
                     value TEXT,
-                    expires_at TIMESTAMP
-                )
+                    expires_at INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_expires ON cache_entries(expires_at);
             """)
     
     def set(self, key: str, value: any, expires_in: int = 3600):
-        expires_at = datetime.utcnow() + timedelta(seconds=expires_in)
-        with sqlite3.connect(self.db_name) as conn:
-            conn.execute(
-                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
-                (key, json.dumps(value), expires_at.isoformat())
-            )
+        expires_at = int(time.time()) + expires_in
+        with self._conn_lock:
+            self._conn.execute(self._SET_SQL, (key, orjson.dumps(value).decode(), expires_at))
+    
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_name, isolation_level=None)
+            conn.execute("PRAGMA mmap_size=268435456")
+            self._readers.conn = conn
+        return conn
     
     def get(self, key: str) -> any:
-        with sqlite3.connect(self.db_name) as conn:
-            result = conn.execute(
-                "SELECT value, expires_at FROM cache WHERE key = ?",
-                (key,)
-            ).fetchone()
-            
-            if result is None:
-                return None
-                
-            value, expires_at = result
-            if datetime.fromisoformat(expires_at) < datetime.utcnow():
-                self.delete(key)
-                return None
-                
-            return json.loads(value)
+        # Expired rows are filtered in SQL rather than parsed and compared here
+        result = self._reader().execute(self._GET_SQL, (key, int(time.time()))).fetchone()
+        
+        if result is None:
+            return None
+        return orjson.loads(result[0])
     
     def delete(self, key: str):
-        with sqlite3.connect(self.db_name) as conn:
-            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        with self._conn_lock:
+            self._conn.execute(self._DELETE_SQL, (key,))
+    
+    def sweep_expired(self) -> int:
+        """Delete expired entries through the expires_at index"""
+        with self._conn_lock:
+            return self._conn.execute(self._SWEEP_SQL, (int(time.time()),)).rowcount
+
+cache = SQLiteCache()
+
+class SemanticCache:
+    """Exact-prompt cache (in-process, then SQLite) plus a nearest-neighbour lookup over past queries"""
+
+    def __init__(self, ttl: int = 3600, threshold: float = 0.85, maxsize: int = 4096):
+        self.ttl = ttl
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.exact: TTLCache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.index: Optional[faiss.Index] = None
+        self.entries: List[Tuple[str, Any, float]] = []  # (scope, value, expires_at)
+
+    async def get_exact(self, key: str) -> Any:
+        if key in self.exact:
+            return self.exact[key]
+        try:
+            value = await asyncio.to_thread(cache.get, key)
+        except sqlite3.Error as e:
+            logger.error(f"Error reading response cache: {str(e)}")
+            return None
+        if value is not None:
+            self.exact[key] = value
+        return value
 
-cache = SQLiteCache()
\ No newline at end of file
+    def get_similar(self, scope: str, embedding: np.ndarray) -> Any:
+        """Return the stored answer of a close enough past query in the same scope"""
+        if self.index is None or not self.entries:
+            return None
+        
+        D, I = self.index.search(self._normalize(embedding), min(4, len(self.entries)))
+        now = time.time()
+        for similarity, idx in zip(D[0].tolist(), I[0].tolist()):
+            if idx < 0 or similarity < self.threshold:
+                break
+            entry_scope, value, expires_at = self.entries[idx]
+            if entry_scope == scope and expires_at > now:
+                return value
+        return None
+
+    async def set(self, key: str, scope: str, embedding: Optional[np.ndarray], value: Any):
+        self.exact[key] = value
+        try:
+            await asyncio.to_thread(cache.set, key, value, self.ttl)
+        except sqlite3.Error as e:
+            logger.error(f"Error writing response cache: {str(e)}")
+        
+        if embedding is None:
+            return
+        vector = self._normalize(embedding)
+        if self.index is None or len(self.entries) >= self.maxsize:
+            # Start over rather than growing without bound; HNSW can't delete
+            self.index = faiss.IndexHNSWFlat(vector.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+            self.entries = []
+        self.index.add(vector)
+        self.entries.append((scope, value, time.time() + self.ttl))
+
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.array(embedding, dtype=np.float32, ndmin=2)
+        faiss.normalize_L2(vector)
+        return vector
+
+def semantic_cached(
+    ttl: int = 3600,
+    threshold: Optional[float] = None,
+    semantic: bool = True,
+    llm_attr: str = "llm"
+):
+    """Cache an LLM method taking (prompt, query), exactly by prompt and semantically by query
+
+    Semantic hits are limited to prompts that are identical apart from the query,
+    so a reworded question only reuses an answer given for the same context.
+    With `semantic=False` only exact prompts are reused. Otherwise the instance
+    must provide `embed_one(text)`. Entries are keyed by the model name of the
+    instance's `llm_attr` LLM, the one that answers the call.
+    """
+    def decorator(func):
+        store = SemanticCache(
+            ttl=ttl,
+            threshold=threshold if threshold is not None else settings.semantic_cache_threshold
+        )
+
+        @functools.wraps(func)
+        async def wrapper(self, prompt: str, query: str):
+            model_name = getattr(self, llm_attr).model_name
+            key = "llm:" + hashlib.sha256(f"{model_name}:{prompt}".encode()).hexdigest()
+            value = await store.get_exact(key)
+            if value is not None:
+                return value
+            
+            if not semantic:
+                value = await func(self, prompt, query)
+                await store.set(key, "", None, value)
+                return value
+            
+            template = prompt.replace(query, "\0")
+            scope = hashlib.sha256(f"{model_name}:{template}".encode()).hexdigest()
+            try:
+                embedding = await self.embed_one(query)
+            except Exception as e:
+                logger.error(f"Error embedding query for semantic cache: {str(e)}")
+                embedding = None
+            if embedding is not None:
+                value = store.get_similar(scope, embedding)
+                if value is not None:
+                    return value
+            
+            value = await func(self, prompt, query)
+            await store.set(key, scope, embedding, value)
+            return value
+        return wrapper
+    return decorator
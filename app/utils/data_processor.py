@@ -1,12 +1,25 @@
 import pandas as pd
 import numpy as np
 from typing import List, Dict, Tuple
+from collections import defaultdict
 from app.models.schemas import Cocktail, CocktailIngredient
 import ast
+import orjson
 import logging
 
 logger = logging.getLogger(__name__)
 
+def _parse_list(value: str) -> list:
+    """Parse a Python list literal, through the JSON parser when it is JSON-compatible"""
+    # Rewriting quotes would corrupt names with apostrophes, so single-quoted lists
+    # always go through the literal parser
+    if "'" not in value:
+        try:
+            return orjson.loads(value)
+        except orjson.JSONDecodeError:
+            pass  # None entries, etc.
+    return ast.literal_eval(value)
+
 class DataProcessor:
     def __init__(self):
         self.df: Optional[pd.DataFrame] = None
@@ -15,37 +28,47 @@ class DataProcessor:
     def process_csv_data(self, csv_content: str) -> List[Cocktail]:
         """Process CSV data and convert to Cocktail objects"""
         try:
-            # Parse CSV content
-            df = pd.read_csv(csv_content)
+            # Parse CSV content with the multithreaded Arrow reader and a fixed schema
+            df = pd.read_csv(
+                csv_content,
+                engine="pyarrow",
+                usecols=[
+                    'id', 'name', 'alcoholic', 'category', 'glassType', 'instructions',
+                    'drinkThumbnail', 'ingredients', 'ingredientMeasures'
+                ],
+                dtype={
+                    'id': 'int32',
+                    'name': 'string',
+                    'alcoholic': 'category',
+                    'category': 'category',
+                    'glassType': 'category'
+                }
+            )
             
             # Convert ingredients and measures from string to list
-            df['ingredients'] = df['ingredients'].apply(ast.literal_eval)
-            df['ingredientMeasures'] = df['ingredientMeasures'].apply(ast.literal_eval)
+            df['ingredients'] = [_parse_list(v) for v in df['ingredients']]
+            df['ingredientMeasures'] = [_parse_list(v) for v in df['ingredientMeasures']]
             
             # Convert to Cocktail objects
-            cocktails = []
-            for _, row in df.iterrows():
-                ingredients = [
-                    CocktailIngredient(
-                        name=ing,
-                        measure=measure if pd.notna(measure) else None
-                    )
-                    for ing, measure in zip(row['ingredients'], row['ingredientMeasures'])
-                ]
-                
-                cocktail = Cocktail(
-                    id=row['id'],
-                    name=row['name'],
-                    alcoholic=row['alcoholic'].lower() == 'alcoholic',
-                    category=row['category'],
-                    glass_type=row['glassType'],
-                    instructions=row['instructions'],
-                    thumbnail_url=row['drinkThumbnail'],
-                    ingredients=ingredients
+            return [
+                Cocktail(
+                    id=row.id,
+                    name=row.name,
+                    alcoholic=row.alcoholic.lower() == 'alcoholic',
+                    category=row.category,
+                    glass_type=row.glassType,
+                    instructions=row.instructions,
+                    thumbnail_url=row.drinkThumbnail,
+                    ingredients=[
+                        CocktailIngredient(
+                            name=ing,
+                            measure=measure if pd.notna(measure) else None
+                        )
+                        for ing, measure in zip(row.ingredients, row.ingredientMeasures)
+                    ]
                 )
-                cocktails.append(cocktail)
-            
-            return cocktails
+                for row in df.itertuples(index=False)
+            ]
             
         except Exception as e:
             logger.error(f"Error processing CSV data: {str(e)}")
@@ -53,14 +76,11 @@ class DataProcessor:
 
     def create_search_index(self, cocktails: List[Cocktail]) -> Dict[str, List[int]]:
         """Create inverted index for ingredient-based search"""
-        index = {}
+        index = defaultdict(list)
         for cocktail in cocktails:
             for ingredient in cocktail.ingredients:
-                ing_name = ingredient.name.lower()
-                if ing_name not in index:
-                    index[ing_name] = []
-                index[ing_name].append(cocktail.id)
-        return index
+                index[ingredient.name.lower()].append(cocktail.id)
+        return dict(index)
 
     def generate_cocktail_embedding(self, cocktail: Cocktail) -> str:
         """Generate text representation for embedding"""
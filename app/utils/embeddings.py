@@ -1,35 +1,57 @@
 import numpy as np
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import logging
 from app.config import settings
 import torch
 from transformers import AutoTokenizer, AutoModel
 import faiss
 from pathlib import Path
-import pickle
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 
 logger = logging.getLogger(__name__)
 
 class EmbeddingManager:
+    # Compiled graphs are specialized to one shape, so GPU batches pad to a fixed length and size
+    max_seq_length = 128
+
     def __init__(self):
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.tokenizer = AutoTokenizer.from_pretrained('sentence-transformers/all-MiniLM-L6-v2')
-        self.model = AutoModel.from_pretrained('sentence-transformers/all-MiniLM-L6-v2').to(self.device)
+        self.model = self._load_model()
         self.index = None
         self.embedding_dim = 384  # MiniLM model dimension
+        # Concurrent searches queued for the next batched index.search
+        self.search_flush_interval = 0.005
+        self._pending: List[Tuple[np.ndarray, int, asyncio.Future]] = []
+        self._search_timer: Optional[asyncio.TimerHandle] = None
         self._initialize_index()
 
+    def _load_model(self):
+        """Load MiniLM compiled in FP16 on GPU or with int8 dynamic quantization on CPU"""
+        model = AutoModel.from_pretrained('sentence-transformers/all-MiniLM-L6-v2').eval()
+        if self.device.type == 'cuda':
+            # Default mode: fused kernels without CUDA graphs, whose static buffers
+            # would be shared by batches running on the two streams in _encode_batches.
+            # Inputs are padded to one shape, so this compiles once.
+            return torch.compile(model.half().to(self.device), dynamic=False)
+        return torch.ao.quantization.quantize_dynamic(
+            model,
+            {torch.nn.Linear},
+            dtype=torch.qint8
+        )
+
     def _initialize_index(self):
         """Initialize FAISS index"""
         try:
-            index_path = Path(settings.embeddings_dir) / "faiss_index.pkl"
+            index_path = Path(settings.embeddings_dir) / "faiss_index.faiss"
             if index_path.exists():
-                with open(index_path, 'rb') as f:
-                    self.index = pickle.load(f)
+                self.index = faiss.read_index(str(index_path))
                 logger.info("Loaded existing FAISS index")
             else:
-                self.index = faiss.IndexFlatL2(self.embedding_dim)
+                self.index = faiss.IndexHNSWFlat(self.embedding_dim, 32)
+                self.index.hnsw.efConstruction = 200
                 logger.info("Created new FAISS index")
         except Exception as e:
             logger.error(f"Error initializing FAISS index: {str(e)}")
@@ -42,33 +64,95 @@ class EmbeddingManager:
     ) -> np.ndarray:
         """Generate embeddings for texts using batched processing"""
         try:
-            all_embeddings = []
+            # Embed each distinct text once, then scatter back to the input order
+            unique = {}
+            order = [unique.setdefault(text, len(unique)) for text in texts]
+            if len(unique) < len(texts):
+                return (await self.generate_embeddings(list(unique), batch_size))[order]
             
-            for i in range(0, len(texts), batch_size):
-                batch = texts[i:i + batch_size]
-                inputs = self.tokenizer(
-                    batch,
-                    padding=True,
-                    truncation=True,
-                    max_length=512,
-                    return_tensors='pt'
-                ).to(self.device)
-                
-                with torch.no_grad():
-                    outputs = self.model(**inputs)
-                    embeddings = self._mean_pooling(outputs, inputs['attention_mask'])
-                    embeddings = embeddings.cpu().numpy()
-                    all_embeddings.append(embeddings)
-                
-            return np.vstack(all_embeddings)
+            batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+            if not batches:
+                return np.zeros((0, self.embedding_dim), dtype=np.float32)
+            
+            # Inference blocks; keep it off the event loop
+            return await asyncio.to_thread(self._encode_batches, batches, batch_size)
             
         except Exception as e:
             logger.error(f"Error generating embeddings: {str(e)}")
             raise
 
+    def _tokenize(self, batch: List[str], batch_size: int):
+        """Tokenize a batch, pinning host memory so the device copy can be async"""
+        if self.device.type == 'cuda':
+            # Pad the batch dimension too so a short final batch reuses the compiled graph
+            inputs = self.tokenizer(
+                batch + [""] * (batch_size - len(batch)),
+                padding='max_length',
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors='pt'
+            )
+            return {k: v.pin_memory() for k, v in inputs.items()}
+        return self.tokenizer(
+            batch,
+            padding=True,
+            truncation=True,
+            max_length=512,
+            return_tensors='pt'
+        )
+
+    def _encode_batches(self, batches: List[List[str]], batch_size: int) -> np.ndarray:
+        """Run batches through the model, overlapping tokenization, copies and compute"""
+        use_cuda = self.device.type == 'cuda'
+        streams = [torch.cuda.Stream(), torch.cuda.Stream()] if use_cuda else []
+        # Batches are written straight into the output; no list of parts to concatenate
+        out = torch.empty(
+            (sum(len(batch) for batch in batches), self.embedding_dim),
+            dtype=torch.float32,
+            pin_memory=use_cuda
+        )
+        offset = 0
+        
+        # A single worker tokenizes ahead (the tokenizer is not thread-safe)
+        with ThreadPoolExecutor(max_workers=1) as tokenizer_pool, torch.inference_mode():
+            pending = [
+                tokenizer_pool.submit(self._tokenize, batch, batch_size)
+                for batch in batches
+            ]
+            
+            for i, future in enumerate(pending):
+                inputs = future.result()
+                count = len(batches[i])
+                
+                if use_cuda:
+                    # Alternate streams so one batch's copies overlap the other's compute
+                    with torch.cuda.stream(streams[i % 2]), torch.autocast(
+                        device_type='cuda',
+                        dtype=torch.float16
+                    ):
+                        inputs = {
+                            k: v.to(self.device, non_blocking=True)
+                            for k, v in inputs.items()
+                        }
+                        outputs = self.model(**inputs)
+                        embeddings = self._mean_pooling(outputs, inputs['attention_mask'])
+                        out[offset:offset + count].copy_(embeddings[:count], non_blocking=True)
+                else:
+                    outputs = self.model(**inputs)
+                    embeddings = self._mean_pooling(outputs, inputs['attention_mask'])
+                    out[offset:offset + count] = embeddings
+                offset += count
+        
+        if use_cuda:
+            torch.cuda.synchronize()
+        
+        # Shares memory with the tensor; no copy
+        return out.numpy()
+
     def _mean_pooling(self, model_output, attention_mask):
         """Perform mean pooling on token embeddings"""
-        token_embeddings = model_output[0]
+        # Pool in FP32 so half-precision activations don't lose precision in the sum
+        token_embeddings = model_output[0].float()
         input_mask_expanded = attention_mask.unsqueeze(-1).expand(token_embeddings.size()).float()
         return torch.sum(token_embeddings * input_mask_expanded, 1) / torch.clamp(input_mask_expanded.sum(1), min=1e-9)
 
@@ -99,12 +183,11 @@ class EmbeddingManager:
             timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
             
             # Save with timestamp
-            save_path = index_path / f"faiss_index_{timestamp}.pkl"
-            with open(save_path, 'wb') as f:
-                pickle.dump(self.index, f)
+            save_path = index_path / f"faiss_index_{timestamp}.faiss"
+            faiss.write_index(self.index, str(save_path))
                 
             # Update symlink to latest
-            latest_path = index_path / "faiss_index.pkl"
+            latest_path = index_path / "faiss_index.faiss"
             if latest_path.exists():
                 latest_path.unlink()
             latest_path.symlink_to(save_path)
@@ -121,12 +204,18 @@ class EmbeddingManager:
         k: int = 5,
         distance_threshold: Optional[float] = None
     ) -> tuple[np.ndarray, np.ndarray]:
-        """Search for similar embeddings in the index"""
+        """Search for similar embeddings, batched with concurrent searches"""
         try:
-            distances, indices = self.index.search(
-                query_embedding.reshape(1, -1),
-                k
-            )
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending.append((query_embedding.reshape(1, -1), k, future))
+            if self._search_timer is None:
+                self._search_timer = loop.call_later(
+                    self.search_flush_interval,
+                    self._flush_searches
+                )
+            
+            distances, indices = await future
             
             if distance_threshold is not None:
                 mask = distances[0] < distance_threshold
@@ -139,6 +228,32 @@ class EmbeddingManager:
             logger.error(f"Error searching index: {str(e)}")
             raise
 
+    def search_batch(self, queries: np.ndarray, k: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """Search the index for a matrix of queries in one call"""
+        return self.index.search(np.ascontiguousarray(queries, dtype=np.float32), k)
+
+    def _flush_searches(self):
+        """Run all queued searches as one batched index.search"""
+        self._search_timer = None
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        
+        try:
+            distances, indices = self.search_batch(
+                np.vstack([query for query, _, _ in pending]),
+                max(k for _, k, _ in pending)
+            )
+        except Exception as e:
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        
+        for row, (_, k, future) in enumerate(pending):
+            if not future.done():
+                future.set_result((distances[row:row + 1, :k], indices[row:row + 1, :k]))
+
     def cleanup(self):
         """Cleanup resources"""
         try:
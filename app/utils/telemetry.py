@@ -0,0 +1,42 @@
+from typing import List, Optional, Tuple
+from redis.asyncio.connection import Connection, ConnectionPool
+import redis.asyncio as redis
+import logging
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class FireAndForgetRedis:
+    """Dedicated Redis connection with replies switched off, for writes nobody reads back"""
+
+    def __init__(self, url: str = settings.redis_url):
+        self._pool = ConnectionPool.from_url(url)
+        self._conn: Optional[Connection] = None
+
+    async def _connect(self) -> Connection:
+        conn = self._pool.make_connection()
+        await conn.connect()
+        # The server stops replying on this connection, so nothing is ever read back
+        await conn.send_command("CLIENT", "REPLY", "OFF")
+        return conn
+
+    async def send(self, commands: List[Tuple]):
+        """Write all commands in one packed send without waiting for replies"""
+        if not commands:
+            return
+        try:
+            if self._conn is None:
+                self._conn = await self._connect()
+            await self._conn.send_packed_command(self._conn.pack_commands(commands))
+        except (redis.RedisError, OSError) as e:
+            # Telemetry is best effort; drop this batch and reconnect next time
+            logger.error(f"Redis error sending telemetry: {str(e)}")
+            await self.close()
+
+    async def close(self):
+        """Close the connection"""
+        if self._conn is not None:
+            await self._conn.disconnect()
+            self._conn = None
+
+telemetry = FireAndForgetRedis()
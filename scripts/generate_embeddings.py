@@ -7,6 +7,7 @@ import os
 import asyncio
 from typing import List, Dict
 from datetime import datetime
+from openai import RateLimitError
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
@@ -68,23 +69,45 @@ class EmbeddingsGenerator:
                 f"{cocktail['instructions']}"
             )
             texts.append(text)
+        
+        # Local models batch internally and have no rate limits
+        if settings.embedding_backend != "openai":
+            return np.array(await self.llm_service.generate_embeddings(texts))
             
-        # Generate embeddings in batches
+        # Generate embeddings in batches, several in flight at once
         batch_size = 100
-        all_embeddings = []
+        semaphore = asyncio.Semaphore(settings.embedding_concurrency)
         
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            logger.info(f"Processing batch {i//batch_size + 1}...")
-            
-            batch_embeddings = await self.llm_service.generate_embeddings(batch)
-            all_embeddings.extend(batch_embeddings)
-            
-            # Add small delay to avoid rate limits
-            await asyncio.sleep(0.1)
+        async def _embed_batch(batch_number: int, batch: List[str]) -> np.ndarray:
+            async with semaphore:
+                logger.info(f"Processing batch {batch_number}...")
+                return await self._embed_with_backoff(batch)
+        
+        results = await asyncio.gather(*(
+            _embed_batch(i // batch_size + 1, texts[i:i + batch_size])
+            for i in range(0, len(texts), batch_size)
+        ))
+        all_embeddings = [embedding for batch in results for embedding in batch]
             
         return np.array(all_embeddings)
         
+    async def _embed_with_backoff(
+        self,
+        batch: List[str],
+        max_retries: int = 5
+    ) -> np.ndarray:
+        """Embed a batch, backing off exponentially when rate limited"""
+        delay = 1.0
+        for attempt in range(max_retries):
+            try:
+                return await self.llm_service.generate_embeddings(batch)
+            except RateLimitError:
+                if attempt == max_retries - 1:
+                    raise
+                logger.warning(f"Rate limited, retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay *= 2
+        
     def _save_embeddings(self, embeddings: np.ndarray):
         """Save generated embeddings"""
         timestamp = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
@@ -1,54 +1,157 @@
+import os
+from pathlib import Path
+
+# Keep the test index apart from the app's and reuse it across runs; CocktailService
+# rebuilds it only when the CSV or the embedding and index settings change
+os.environ.setdefault(
+    "VECTOR_DB_PATH",
+    str(Path(__file__).parent / ".cache" / "vector_store")
+)
+# The index is already HNSW; a shallower graph is plenty for the test corpus
+os.environ.setdefault("HNSW_EF_CONSTRUCTION", "40")
+os.environ.setdefault("HNSW_EF_SEARCH", "16")
+# int8 codes even if a local .env switches the app to full-precision storage
+os.environ.setdefault("VECTOR_INDEX_FACTORY", "HNSW32,SQ8")
+
 import pytest
-from fastapi.testclient import TestClient
-from app.main import app
+import pytest_asyncio
 from app.services.cocktail_service import CocktailService
 from app.services.chat_service import ChatService
 from app.database.vector_store import VectorStore
+from app.services.llm_service import LLMService
+from app.config import settings
+import numpy as np
 import asyncio
+import hashlib
 import json
+import uuid
+from types import MappingProxyType
 
-@pytest.fixture
-def test_client():
-    return TestClient(app)
+try:
+    import uvloop
+except ImportError:  # not available on Windows
+    uvloop = None
 
-@pytest.fixture
-def cocktail_service():
-    return CocktailService()
+# Every query and chat message the suite embeds
+WARM_QUERIES = (
+    "something refreshing",
+    "mojito",
+    "Recommend me a cocktail with rum",
+    "What can I make with vodka?",
+    "What cocktails can I make with rum and lime?",
+    "I like rum and mint",
+    "I like rum and mint, but I'm allergic to nuts"
+)
 
-@pytest.fixture
-def chat_service():
-    return ChatService()
+# Read-only payloads shared by every test; copy before changing them
+SAMPLE_COCKTAIL = MappingProxyType({
+    "id": 1,
+    "name": "Test Cocktail",
+    "alcoholic": True,
+    "category": "Test Category",
+    "glass_type": "Test Glass",
+    "instructions": "Test instructions",
+    "ingredients": (
+        MappingProxyType({"name": "Test Ingredient 1", "measure": "1 oz"}),
+        MappingProxyType({"name": "Test Ingredient 2", "measure": "2 oz"})
+    )
+})
+
+SAMPLE_USER_PREFERENCES = MappingProxyType({
+    "user_id": "test_user",
+    "favorite_ingredients": ("rum", "lime"),
+    "allergies": ("nuts",),
+    "preferred_alcohol_types": ("rum", "vodka")
+})
+
+@pytest_asyncio.fixture(scope="session")
+async def cocktail_service():
+    # Dataset parsing and index building happen once per test run
+    service = CocktailService()
+    await service.initialize_data()
+    assert len(service.cocktails) > 0
+    assert len(service.ingredient_index) > 0
+    # Warm the query embedding cache so search tests measure retrieval, not the model.
+    # The concurrent calls coalesce in the MicroBatcher into a single encode.
+    await asyncio.gather(
+        *(service.embed_query(query) for query in WARM_QUERIES),
+        *(service.llm_service.embed_one(query) for query in WARM_QUERIES)
+    )
+    yield service
+    await service.llm_service.close()
 
 @pytest.fixture
+def bare_cocktail_service(cocktail_service):
+    # No dataset loaded; shares the session clients to skip loading the model again
+    return CocktailService(cocktail_service.llm_service, cocktail_service.vector_store)
+
+@pytest.fixture(scope="session")
+def chat_service(cocktail_service):
+    return ChatService(
+        llm_service=cocktail_service.llm_service,
+        cocktail_service=cocktail_service,
+        vector_store=cocktail_service.vector_store
+    )
+
+@pytest.fixture(scope="session")
 def vector_store():
-    return VectorStore()
+    store = VectorStore()
+    yield store
+    store.reset_cocktail_index()
 
 @pytest.fixture
+def user_id():
+    # Session-scoped services are shared, so stateful tests use their own user
+    return uuid.uuid4().hex
+
+@pytest.fixture(scope="session")
 def sample_cocktail_data():
-    return {
-        "id": 1,
-        "name": "Test Cocktail",
-        "alcoholic": True,
-        "category": "Test Category",
-        "glass_type": "Test Glass",
-        "instructions": "Test instructions",
-        "ingredients": [
-            {"name": "Test Ingredient 1", "measure": "1 oz"},
-            {"name": "Test Ingredient 2", "measure": "2 oz"}
-        ]
-    }
+    return SAMPLE_COCKTAIL
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def sample_user_preferences():
-    return {
-        "user_id": "test_user",
-        "favorite_ingredients": ["rum", "lime"],
-        "allergies": ["nuts"],
-        "preferred_alcohol_types": ["rum", "vodka"]
-    }
+    return SAMPLE_USER_PREFERENCES
+
+def _stub_embedding(text: str) -> np.ndarray:
+    # Seeded from a stable digest; str hash() changes between processes
+    seed = int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little")
+    return np.random.default_rng(seed).standard_normal(settings.embedding_dimension).astype(np.float32)
 
 @pytest.fixture
+def stub_embedder(monkeypatch):
+    """Deterministic embeddings instead of the embedding model"""
+    async def generate_embeddings(self, texts, batch_size=None):
+        vectors = [_stub_embedding(text) for text in texts]
+        return np.stack(vectors) if vectors else np.zeros((0, settings.embedding_dimension), np.float32)
+    
+    async def embed_one(self, text, cache_key=None):
+        return _stub_embedding(text)
+    
+    monkeypatch.setattr(LLMService, "generate_embeddings", generate_embeddings)
+    monkeypatch.setattr(LLMService, "embed_one", embed_one)
+
+@pytest.fixture
+def stub_llm(monkeypatch):
+    """Canned chat model output instead of API calls"""
+    async def complete(self, prompt, query):
+        return "Try a classic Daiquiri: rum, lime juice and simple syrup."
+    
+    async def complete_json(self, prompt, query):
+        return json.dumps({
+            "type": "general_query",
+            "ingredients": [],
+            "favorite_ingredients": [],
+            "favorite_cocktails": [],
+            "allergies": [],
+            "preferred_alcohol_types": []
+        })
+    
+    monkeypatch.setattr(LLMService, "_complete", complete)
+    monkeypatch.setattr(LLMService, "_complete_json", complete_json)
+
+@pytest.fixture(scope="session")
 def event_loop():
-    loop = asyncio.get_event_loop()
+    # One loop for the whole run, shared by every async test and fixture
+    loop = uvloop.new_event_loop() if uvloop is not None else asyncio.new_event_loop()
     yield loop
     loop.close()
\ No newline at end of file
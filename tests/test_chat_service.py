@@ -1,8 +1,20 @@
 import pytest
+from unittest.mock import AsyncMock
 from app.services.chat_service import ChatService
+from app.services.llm_service import LLMService
 from app.models.schemas import ChatResponse
 import json
 
+# Keep the tests sharing a heavy session fixture on one xdist worker
+pytestmark = pytest.mark.xdist_group("chat_service")
+
+@pytest.fixture(autouse=True)
+def reset_chat_state(chat_service):
+    # The session ChatService is shared; drop what each test left behind
+    yield
+    chat_service.reset_user_state()
+
+@pytest.mark.slow
 @pytest.mark.asyncio
 async def test_process_message(chat_service):
     message = "What cocktails can I make with rum and lime?"
@@ -13,6 +25,7 @@ async def test_process_message(chat_service):
     assert response.confidence_score >= 0.0
     assert response.confidence_score <= 1.0
 
+@pytest.mark.slow
 @pytest.mark.asyncio
 async def test_analyze_intent(chat_service):
     message = "I like rum and mint"
@@ -21,29 +34,91 @@ async def test_analyze_intent(chat_service):
     assert isinstance(intent, dict)
     assert "type" in intent
 
+@pytest.mark.slow
+class TestChatHandlers:
+    @pytest.mark.parametrize("method,message,takes_user,check", [
+        (
+            "_handle_recommendation_intent",
+            "Recommend me a cocktail with rum",
+            True,
+            lambda r: r.cocktails is not None and len(r.cocktails) > 0
+        ),
+        (
+            "_handle_ingredient_query",
+            "What can I make with vodka?",
+            False,
+            lambda r: bool(r.message) and "vodka" in r.message.lower()
+        ),
+        (
+            "_handle_preference_update",
+            "I like rum and mint, but I'm allergic to nuts",
+            True,
+            lambda r: bool(r.message) and r.confidence_score == 1.0
+        ),
+    ])
+    @pytest.mark.asyncio
+    async def test_handler(self, chat_service, user_id, method, message, takes_user, check):
+        handler = getattr(chat_service, method)
+        response = await (handler(message, user_id) if takes_user else handler(message))
+        
+        assert isinstance(response, ChatResponse)
+        assert check(response)
+
 @pytest.mark.asyncio
-async def test_handle_recommendation_intent(chat_service):
-    message = "Recommend me a cocktail with rum"
-    response = await chat_service._handle_recommendation_intent(message, "test_user")
+async def test_conversation_history_is_bounded(chat_service, user_id):
+    for i in range(15):
+        chat_service._add_to_history(user_id, "user", f"message {i}")
     
-    assert isinstance(response, ChatResponse)
-    assert response.cocktails is not None
-    assert len(response.cocktails) > 0
+    history = await chat_service.get_conversation_history(user_id, limit=3)
+    
+    assert len(chat_service.conversation_history[user_id]) == 10
+    assert [m.content for m in history] == ["message 12", "message 13", "message 14"]
 
 @pytest.mark.asyncio
-async def test_handle_ingredient_query(chat_service):
-    message = "What can I make with vodka?"
-    response = await chat_service._handle_ingredient_query(message)
+async def test_process_message_with_stubbed_backends(chat_service, stub_embedder, stub_llm, user_id):
+    response = await chat_service.process_message("What should I drink tonight?", user_id)
     
     assert isinstance(response, ChatResponse)
-    assert response.message
-    assert "vodka" in response.message.lower()
+    assert "Daiquiri" in response.message
+    assert 0.0 <= response.confidence_score <= 1.0
 
 @pytest.mark.asyncio
-async def test_handle_preference_update(chat_service):
-    message = "I like rum and mint, but I'm allergic to nuts"
-    response = await chat_service._handle_preference_update(message, "test_user")
+async def test_process_message_reuses_entities_from_intent(
+    chat_service, stub_embedder, stub_llm, monkeypatch, user_id
+):
+    async def analyze_text(self, text):
+        return {"type": "ingredient_query", "ingredients": ["rum", "lime"]}
+    
+    extract_ingredients = AsyncMock(return_value=[])
+    monkeypatch.setattr(LLMService, "analyze_text", analyze_text)
+    monkeypatch.setattr(LLMService, "extract_ingredients", extract_ingredients)
+    
+    response = await chat_service.process_message("What can I make with rum and lime?", user_id)
     
     assert isinstance(response, ChatResponse)
-    assert response.message
-    assert response.confidence_score == 1.0
\ No newline at end of file
+    assert response.confidence_score == 0.9
+    extract_ingredients.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_process_message_reuses_reply_until_state_changes(chat_service, monkeypatch, user_id):
+    reply = ChatResponse(message="Try a Daiquiri", confidence_score=0.9, processing_time=0.0)
+    handler = AsyncMock(return_value=reply)
+    monkeypatch.setattr(chat_service, "_analyze_intent", AsyncMock(return_value={"type": "general_query"}))
+    monkeypatch.setattr(chat_service, "_handle_general_query", handler)
+    message = "What should I drink tonight?"
+    
+    first = await chat_service.process_message(message, user_id)
+    chat_service.conversation_history.pop(user_id)
+    second = await chat_service.process_message(message, user_id)
+    assert handler.await_count == 1
+    assert second.message == first.message
+    
+    # The conversation has moved on, so the same message is answered again
+    await chat_service.process_message(message, user_id)
+    assert handler.await_count == 2
+    
+    # A preference update invalidates replies for the same history
+    chat_service.conversation_history.pop(user_id)
+    chat_service.cocktail_service.preference_versions[user_id] += 1
+    await chat_service.process_message(message, user_id)
+    assert handler.await_count == 3
@@ -1,12 +1,14 @@
 import pytest
+import numpy as np
+from collections import OrderedDict
+from unittest.mock import AsyncMock, Mock
 from app.services.cocktail_service import CocktailService
+from app.services.llm_service import LLMService
 from app.models.schemas import Cocktail, UserPreference
+from app.config import settings
 
-@pytest.mark.asyncio
-async def test_initialize_data(cocktail_service):
-    await cocktail_service.initialize_data()
-    assert cocktail_service.cocktails_df is not None
-    assert len(cocktail_service.ingredient_index) > 0
+# Keep the tests sharing a heavy session fixture on one xdist worker
+pytestmark = pytest.mark.xdist_group("cocktail_service")
 
 @pytest.mark.asyncio
 async def test_recommend_cocktails(cocktail_service):
@@ -22,7 +24,7 @@ async def test_recommend_cocktails(cocktail_service):
     )
     
     assert isinstance(recommendations, list)
-    assert all(isinstance(c, Cocktail) for c in recommendations)
+    assert all(type(c) is Cocktail for c in recommendations)
 
 @pytest.mark.asyncio
 async def test_search_cocktails(cocktail_service):
@@ -30,7 +32,15 @@ async def test_search_cocktails(cocktail_service):
     
     assert isinstance(results, list)
     assert len(results) > 0
-    assert all(isinstance(c, Cocktail) for c in results)
+    assert all(type(c) is Cocktail for c in results)
+
+@pytest.mark.asyncio
+async def test_find_similar_cocktails_clears_similarity_threshold(cocktail_service):
+    query_embedding = await cocktail_service.embed_query("refreshing rum and mint cocktail")
+    results = await cocktail_service.vector_store.find_similar_cocktails(query_embedding, k=5)
+    
+    assert len(results) > 0
+    assert all(type(c) is Cocktail for c, _ in results)
 
 @pytest.mark.asyncio
 async def test_get_cocktails_by_ingredients(cocktail_service):
@@ -38,8 +48,91 @@ async def test_get_cocktails_by_ingredients(cocktail_service):
     results = await cocktail_service.get_cocktails_by_ingredients(ingredients)
     
     assert isinstance(results, list)
-    assert all(isinstance(c, Cocktail) for c in results)
-    assert all(
-        any(i in [ing.name.lower() for ing in c.ingredients] for i in ingredients)
-        for c in results
-    )
\ No newline at end of file
+    assert all(type(c) is Cocktail for c in results)
+    wanted = set(ingredients)
+    assert all(wanted & {ing.name.lower() for ing in c.ingredients} for c in results)
+
+def test_apply_user_preferences(bare_cocktail_service, sample_cocktail_data):
+    sample_cocktail_data = {**sample_cocktail_data, "thumbnail_url": None}
+    safe = Cocktail(
+        **{**sample_cocktail_data, "id": 1, "name": "Safe"},
+        complexity_score=0.5,
+        popularity_score=0.5
+    )
+    favorite = Cocktail(
+        **{
+            **sample_cocktail_data,
+            "id": 2,
+            "name": "Favorite",
+            "ingredients": [{"name": "Rum"}, {"name": "Lime"}]
+        },
+        complexity_score=0.5,
+        popularity_score=0.5
+    )
+    allergic = Cocktail(
+        **{
+            **sample_cocktail_data,
+            "id": 3,
+            "name": "Allergic",
+            "ingredients": [{"name": "Rum"}, {"name": "Crushed Nuts"}]
+        },
+        complexity_score=0.5,
+        popularity_score=0.5
+    )
+    preferences = UserPreference(
+        user_id="test_user",
+        favorite_ingredients=["rum", "lime"],
+        allergies=["nuts"]
+    )
+    
+    results = bare_cocktail_service._apply_user_preferences(
+        [safe, favorite, allergic],
+        preferences
+    )
+    
+    assert [c.name for c in results] == ["Favorite", "Safe"]
+
+
+def test_apply_user_preferences_ignores_colliding_dataset_ids(cocktail_service, sample_cocktail_data):
+    # Reuses the id of a loaded cocktail but carries different ingredients
+    allergic = Cocktail(
+        **{
+            **sample_cocktail_data,
+            "id": cocktail_service.cocktails[0].id,
+            "thumbnail_url": None,
+            "name": "Allergic",
+            "ingredients": [{"name": "Rum"}, {"name": "Crushed Nuts"}]
+        },
+        complexity_score=0.5,
+        popularity_score=0.5
+    )
+    preferences = UserPreference(user_id="test_user", allergies=["nuts"])
+    
+    assert cocktail_service._apply_user_preferences([allergic], preferences) == []
+
+@pytest.mark.parametrize("name,value", [
+    ("vector_index_factory", "Flat"),
+    ("embedding_dimension", 1536),
+    ("embedding_backend", "openai"),
+])
+def test_data_hash_covers_index_settings(tmp_path, monkeypatch, name, value):
+    csv_path = tmp_path / "cocktails.csv"
+    csv_path.write_text("id,name\n1,Mojito\n")
+    before = CocktailService._data_hash(csv_path)
+    
+    monkeypatch.setattr(settings, name, value)
+    
+    assert CocktailService._data_hash(csv_path) != before
+
+@pytest.mark.asyncio
+async def test_embed_query_embeds_original_text():
+    llm_service = LLMService.__new__(LLMService)
+    llm_service._recent_embeddings = OrderedDict()
+    llm_service.embedding_batcher = Mock(embed_one=AsyncMock(return_value=np.ones(4)))
+    service = CocktailService.__new__(CocktailService)
+    service.llm_service = llm_service
+    
+    await service.embed_query("Rum & Coke?")
+    await service.embed_query("Rum Coke")
+    
+    llm_service.embedding_batcher.embed_one.assert_awaited_once_with("Rum & Coke?")
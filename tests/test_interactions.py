@@ -0,0 +1,35 @@
+import asyncio
+import pytest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock
+from app.database.interactions import InteractionLogger
+from app.utils.telemetry import telemetry
+
+class SlowPool:
+    """Pool stand-in whose COPY takes long enough for stop() to land mid-flush"""
+
+    def __init__(self):
+        self.rows = []
+
+    @asynccontextmanager
+    async def acquire(self):
+        yield self
+
+    async def copy_records_to_table(self, table, records, columns):
+        await asyncio.sleep(0.05)
+        self.rows.extend(records)
+
+@pytest.mark.asyncio
+async def test_stop_flushes_in_flight_and_queued_batches(monkeypatch):
+    monkeypatch.setattr(telemetry, "send", AsyncMock())
+    monkeypatch.setattr(telemetry, "close", AsyncMock())
+    pool = SlowPool()
+    interactions = InteractionLogger(batch_size=2, flush_interval=0.01)
+    
+    await interactions.start(pool)
+    for i in range(5):
+        interactions.log(f"user{i}", "chat")
+    await asyncio.sleep(0.02)  # the writer is now inside its first COPY
+    await interactions.stop()
+    
+    assert sorted(row[0] for row in pool.rows) == [f"user{i}" for i in range(5)]
@@ -0,0 +1,59 @@
+import pytest
+import asyncio
+import numpy as np
+import uuid
+from unittest.mock import AsyncMock, Mock
+from app.services.llm_service import LLMService, MicroBatcher
+
+@pytest.mark.asyncio
+async def test_micro_batcher_coalesces_concurrent_calls():
+    embed_batch = AsyncMock(side_effect=lambda texts: np.array([[len(t)] for t in texts]))
+    batcher = MicroBatcher(embed_batch, max_batch=32, flush_ms=5)
+
+    results = await asyncio.gather(*(batcher.embed_one("x" * n) for n in range(1, 4)))
+
+    embed_batch.assert_awaited_once_with(["x", "xx", "xxx"])
+    assert [r.tolist() for r in results] == [[1], [2], [3]]
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_embeds_duplicates_once():
+    service = LLMService.__new__(LLMService)
+    service.local_embedder = Mock()
+    service.local_embedder.encode.side_effect = lambda texts, **kwargs: np.array([[len(t)] for t in texts])
+
+    embeddings = await service.generate_embeddings(["gin", "vodka", "gin"])
+
+    assert service.local_embedder.encode.call_args.args[0] == ["gin", "vodka"]
+    assert embeddings.tolist() == [[3], [5], [3]]
+
+@pytest.mark.asyncio
+async def test_json_completions_do_not_share_near_duplicate_answers():
+    service = LLMService.__new__(LLMService)
+    # Identical vectors: every query looks like a near-duplicate of every other
+    service.embed_one = AsyncMock(return_value=np.ones(4, dtype=np.float32))
+    service.json_llm = Mock(model_name="json-model")
+    service.json_llm.agenerate = AsyncMock(side_effect=lambda prompts: Mock(
+        generations=[[Mock(text=prompts[0].split(": ", 1)[1])]]
+    ))
+    run = uuid.uuid4().hex
+
+    vodka = await service._complete_json(f"{run} Extract from: vodka cocktails", "vodka cocktails")
+    gin = await service._complete_json(f"{run} Extract from: gin cocktails", "gin cocktails")
+
+    assert vodka == "vodka cocktails"
+    assert gin == "gin cocktails"
+    assert service.json_llm.agenerate.await_count == 2
+
+@pytest.mark.asyncio
+async def test_json_completions_are_keyed_by_the_json_model():
+    service = LLMService.__new__(LLMService)
+    service.json_llm = Mock(model_name="json-model-a")
+    service.json_llm.agenerate = AsyncMock(return_value=Mock(generations=[[Mock(text="{}")]]))
+    prompt = f"{uuid.uuid4().hex} Extract from: rum"
+    
+    await service._complete_json(prompt, "rum")
+    await service._complete_json(prompt, "rum")
+    service.json_llm.model_name = "json-model-b"
+    await service._complete_json(prompt, "rum")
+    
+    assert service.json_llm.agenerate.await_count == 2
@@ -0,0 +1,15 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+from app.services.user_service import UserService
+
+@pytest.mark.asyncio
+async def test_add_to_history_single_pipeline_execute():
+    user_service = UserService()
+    
+    with patch(
+        "redis.asyncio.client.Pipeline.execute",
+        new_callable=AsyncMock
+    ) as execute:
+        await user_service.add_to_history("test_user", {"type": "view"})
+    
+    execute.assert_awaited_once()
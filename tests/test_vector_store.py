@@ -0,0 +1,57 @@
+import os
+import pytest
+import numpy as np
+from unittest.mock import AsyncMock, patch
+from app.config import settings
+from app.database.vector_store import VectorStore
+from app.models.schemas import Cocktail
+
+@pytest.mark.asyncio
+async def test_add_cocktail_embeddings_single_pipeline_execute(vector_store, sample_cocktail_data):
+    cocktails = [
+        Cocktail(
+            **{
+                **sample_cocktail_data,
+                "id": i,
+                "thumbnail_url": None,
+                "complexity_score": 0.5,
+                "popularity_score": 0.5
+            }
+        )
+        for i in range(3)
+    ]
+    embeddings = np.random.rand(len(cocktails), vector_store.dimension).astype(np.float32)
+    
+    with patch(
+        "redis.asyncio.client.Pipeline.execute",
+        new_callable=AsyncMock
+    ) as execute, patch.object(vector_store, "save_indexes", new_callable=AsyncMock):
+        await vector_store.add_cocktail_embeddings(cocktails, embeddings)
+    
+    execute.assert_awaited_once()
+
+def test_write_index_prunes_old_versions(vector_store, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "index_versions_kept", 2)
+    for i in range(3):
+        old_version = tmp_path / f"cocktail_index_2020010{i}_000000_1.faiss"
+        old_version.write_bytes(b"")
+        os.utime(old_version, (i, i))
+    
+    VectorStore._write_index(
+        vector_store.cocktail_index, tmp_path, "cocktail_index", "20300101_000000"
+    )
+    
+    versions = sorted(path.name for path in tmp_path.glob("cocktail_index_*.faiss"))
+    assert len(versions) == 2
+    assert versions[0].startswith("cocktail_index_20200102")
+    assert (tmp_path / "cocktail_index.faiss").resolve().name == versions[1]
+
+def test_load_indexes_applies_configured_ef_search(vector_store, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "vector_db_path", str(tmp_path))
+    index = vector_store._build_index()
+    index.hnsw.efSearch = settings.hnsw_ef_search + 100
+    VectorStore._write_index(index, tmp_path, "cocktail_index", "20300101_000000")
+    
+    store = VectorStore()
+    
+    assert store.cocktail_index.hnsw.efSearch == settings.hnsw_ef_search